@@ -0,0 +1,70 @@
+"""Compare fact-table enrichment: two hash merges vs positional dimension lookups.
+
+    python benchmarks/bench_enrichment.py --rows 1000000 10000000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from generate_data import generate_customers, generate_products, generate_orders, NUM_CUSTOMERS, NUM_PRODUCTS
+from transform import DataTransformer
+
+METHODS = {
+    'merge': DataTransformer._build_fact_merge,
+    'lookup': DataTransformer._build_fact_lookup
+}
+
+def make_inputs(rows, seed=42):
+    rng = np.random.RandomState(seed)
+    transformer = DataTransformer()
+    customers = transformer.clean_customers(generate_customers(NUM_CUSTOMERS))
+    products = transformer.clean_products(generate_products(NUM_PRODUCTS))
+    # orders average three line items
+    orders = generate_orders(rows // 3 + 1, customers, products, rng=rng).iloc[:rows]
+    orders, _ = transformer._clean_orders(orders)
+    return orders, products, customers
+
+def run(method, orders, products, customers, repeat):
+    transformer = DataTransformer()
+    build = METHODS[method]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fact = build(transformer, orders, products, customers)
+        times.append(time.perf_counter() - start)
+        del fact
+    
+    tracemalloc.start()
+    fact = build(transformer, orders, products, customers)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, fact
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    
+    for rows in args.rows:
+        with contextlib.redirect_stdout(io.StringIO()):
+            orders, products, customers = make_inputs(rows)
+        print(f"\n{len(orders):,} order rows")
+        facts, seconds = {}, {}
+        for method in METHODS:
+            seconds[method], peak, facts[method] = run(method, orders, products, customers, args.repeat)
+            print(f"  {method:<7} {seconds[method]:8.3f}s  {len(orders) / seconds[method]:14,.0f} rows/sec  "
+                  f"peak {peak / 1024 ** 2:8.1f} MB")
+        print(f"  speedup {seconds['merge'] / seconds['lookup']:.1f}x, "
+              f"identical output: {facts['merge'].equals(facts['lookup'])}")
+
+if __name__ == '__main__':
+    main()
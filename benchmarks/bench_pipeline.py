@@ -0,0 +1,206 @@
+"""Time every pipeline stage on generated datasets of increasing size.
+
+    python benchmarks/bench_pipeline.py --lines 10000 100000 1000000 10000000 --output bench.json
+    python benchmarks/bench_pipeline.py --lines 100000 --baseline bench.json
+
+Each scale runs in a fresh process so its peak RSS is not inherited from the previous one.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from generate_data import generate_customers, generate_products, write_orders, write_table, NUM_CUSTOMERS, NUM_PRODUCTS
+from extract import DataExtractor
+from transform import DataTransformer
+from load import DataLoader
+from visualize import DataVisualizer, CHARTS
+import instrument
+from instrument import peak_rss_mb, rss_mb
+
+SCALES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+class StageTimer:
+    def __init__(self):
+        self.stages = []
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = {'stage': name}
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield record
+        record['seconds'] = time.perf_counter() - start
+        if record.get('rows'):
+            record['rows_per_sec'] = record['rows'] / max(record['seconds'], 1e-9)
+        record['rss_mb'] = rss_mb()
+        record['peak_rss_mb'] = peak_rss_mb()
+        self.stages.append(record)
+    
+    def add_steps(self, parent, events):
+        # instrument events from inside a timed stage, listed under it but not counted again in the total
+        for event in events:
+            record = {'stage': f"{parent}.{event['stage']}", 'seconds': event['seconds'], 'step': True}
+            if event.get('rows_out'):
+                record['rows'] = event['rows_out']
+                record['rows_per_sec'] = event['rows_per_sec']
+            record['rss_mb'] = event['rss_mb']
+            record['peak_rss_mb'] = event['peak_rss_mb']
+            self.stages.append(record)
+
+def generate(data_dir, lines, file_format, seed=42):
+    np.random.seed(seed)
+    customers = generate_customers(NUM_CUSTOMERS)
+    products = generate_products(NUM_PRODUCTS)
+    write_table(customers, os.path.join(data_dir, f'customers.{file_format}'), file_format)
+    write_table(products, os.path.join(data_dir, f'products.{file_format}'), file_format)
+    # orders average three line items
+    return write_orders(os.path.join(data_dir, f'orders.{file_format}'), max(lines // 3, 1),
+                        customers, products, file_format=file_format, seed=seed)
+
+def run_scale(lines, file_format='csv', backend='sqlite', report_source='rollup'):
+    # charts are written to output/ under the working directory
+    with tempfile.TemporaryDirectory(prefix=f'bench_{lines}_') as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            return _run_scale(workdir, lines, file_format, backend, report_source)
+        finally:
+            os.chdir(cwd)
+
+def _run_scale(workdir, lines, file_format, backend, report_source):
+    data_dir = os.path.join(workdir, 'data')
+    os.makedirs(data_dir)
+    timer = StageTimer()
+    
+    with timer.stage('generate') as s:
+        s['rows'] = generate(data_dir, lines, file_format)
+    
+    with timer.stage('extract_all') as s:
+        raw = DataExtractor(data_dir, file_format).extract_all()
+        s['rows'] = len(raw['orders'])
+    
+    transformer = DataTransformer()
+    with timer.stage('transform.clean_customers') as s:
+        customers = transformer.clean_customers(raw['customers'])
+        s['rows'] = len(customers)
+    with timer.stage('transform.clean_products') as s:
+        products = transformer.clean_products(raw['products'])
+        s['rows'] = len(products)
+    with timer.stage('transform.clean_orders') as s:
+        orders = transformer.clean_orders(raw['orders'])
+        s['rows'] = len(orders)
+    with timer.stage('transform.create_fact_sales') as s:
+        fact = transformer.create_fact_sales(orders, products, customers)
+        s['rows'] = len(fact)
+    del raw, orders
+    
+    loader = DataLoader(db_path=os.path.join(workdir, 'output', f'bench.{backend}'), backend=backend)
+    # load_all reports its table loads, rollup update and indexing as stages of its own
+    instrumentation = instrument.activate(instrument.Instrumentation())
+    try:
+        with timer.stage('load') as s:
+            loader.load_all({'customers': customers, 'products': products, 'fact_sales': fact})
+            s['rows'] = len(fact)
+    finally:
+        instrument.deactivate()
+    timer.add_steps('load', instrumentation.events)
+    loader.db.close()
+    del fact
+    
+    visualizer = DataVisualizer(db_path=loader.db_path, source=report_source, cache_dir=None, backend=backend)
+    for name in CHARTS:
+        with timer.stage(f'visualize.{name}.query') as s:
+            df = visualizer.load_dataset(name)
+            s['rows'] = len(df)
+        with timer.stage(f'visualize.{name}.render'):
+            visualizer.render(name, df)
+    visualizer.close()
+    
+    return {
+        'order_lines': lines,
+        'total_seconds': sum(s['seconds'] for s in timer.stages if s['stage'] != 'generate' and not s.get('step')),
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': timer.stages
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    # a stage regresses when it is slower than the baseline by more than the tolerance
+    previous = {(run['order_lines'], s['stage']): s['seconds']
+                for run in baseline['runs'] for s in run['stages']}
+    regressions = []
+    for run in results['runs']:
+        for s in run['stages']:
+            before = previous.get((run['order_lines'], s['stage']))
+            if before and s['seconds'] > before * (1 + tolerance) and s['seconds'] - before > 0.05:
+                regressions.append((run['order_lines'], s['stage'], before, s['seconds']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, nargs='+', default=SCALES,
+                        help="order lines per dataset")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', dest='file_format')
+    parser.add_argument('--backend', choices=['sqlite', 'duckdb'], default='sqlite')
+    parser.add_argument('--report-source', choices=['rollup', 'fact'], default='rollup')
+    parser.add_argument('--output', default=None, help="write results as JSON to this path")
+    parser.add_argument('--baseline', default=None, help="JSON from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown per stage before it counts as a regression")
+    args = parser.parse_args(argv)
+    
+    results = {
+        'created_at': datetime.now().isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': {'file_format': args.file_format, 'backend': args.backend,
+                    'report_source': args.report_source},
+        'runs': []
+    }
+    for lines in args.lines:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            run = pool.submit(run_scale, lines, args.file_format, args.backend, args.report_source).result()
+        results['runs'].append(run)
+        print(f"\n{lines:,} order lines: {run['total_seconds']:.2f}s, peak RSS {run['peak_rss_mb']:,.0f} MB")
+        for s in run['stages']:
+            rate = f"{s['rows_per_sec']:14,.0f} rows/sec" if 'rows_per_sec' in s else ''
+            print(f"  {s['stage']:<38} {s['seconds']:8.3f}s {rate}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for lines, stage, before, after in regressions:
+            print(f"  REGRESSION {lines:,} lines {stage}: {before:.3f}s -> {after:.3f}s")
+        if regressions:
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+if __name__ == '__main__':
+    main()
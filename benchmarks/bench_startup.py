@@ -0,0 +1,92 @@
+"""Measure how long each main.py command takes to start, before it touches any data.
+
+    python benchmarks/bench_startup.py --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json --max-seconds 1.0
+
+Every sample is a fresh interpreter, so module caches from earlier samples do not hide import cost.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from main import COMMAND_MODULES
+
+# startup_seconds covers importing main.py and the command's modules; the process wall time also
+# includes interpreter start and exit
+PROBE = """
+import time
+start = time.perf_counter()
+import main
+seconds = main.import_command({command!r})
+print(time.perf_counter() - start, seconds)
+"""
+
+def sample(command):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', PROBE.format(command=command)], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stdout.split()
+    wall = time.perf_counter() - start
+    return {'wall_seconds': wall, 'startup_seconds': float(out[0]), 'import_seconds': float(out[1])}
+
+def measure(command, repeat):
+    samples = [sample(command) for _ in range(repeat)]
+    # the median ignores the first, cold-disk sample without hiding a steady slowdown
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commands', nargs='+', choices=list(COMMAND_MODULES), default=list(COMMAND_MODULES))
+    parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per command")
+    parser.add_argument('--output', default=None, help="write results as JSON to this path")
+    parser.add_argument('--baseline', default=None, help="JSON from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown per command before it counts as a regression")
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help="fail if any command takes longer than this to start")
+    args = parser.parse_args(argv)
+    
+    results = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'commands': {}
+    }
+    for command in args.commands:
+        results['commands'][command] = run = measure(command, args.repeat)
+        print(f"  {command:<10} startup {run['startup_seconds']:.3f}s "
+              f"(imports {run['import_seconds']:.3f}s, process {run['wall_seconds']:.3f}s)")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved {args.output}")
+    
+    failures = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['commands']
+        for command, run in results['commands'].items():
+            before = baseline.get(command, {}).get('startup_seconds')
+            if before and run['startup_seconds'] > before * (1 + args.tolerance) \
+                    and run['startup_seconds'] - before > 0.05:
+                failures.append(f"{command}: {before:.3f}s -> {run['startup_seconds']:.3f}s")
+    if args.max_seconds is not None:
+        failures += [f"{command}: {run['startup_seconds']:.3f}s > {args.max_seconds:.3f}s"
+                     for command, run in results['commands'].items()
+                     if run['startup_seconds'] > args.max_seconds]
+    for failure in failures:
+        print(f"  REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
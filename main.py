@@ -1,28 +1,306 @@
-from src.extract import DataExtractor
-from src.transform import DataTransformer
-from src.load import DataLoader
-from src.visualize import DataVisualizer
+import argparse
+import importlib
+import sys
+import time
 
-def run_pipeline():
+STARTED = time.perf_counter()
+
+# modules each command needs, imported only once the command is known: pandas, pyarrow and plotly
+# dominate startup, and a cron job that only loads should not pay for the plotting stack
+COMMAND_MODULES = {
+    'generate': ['src.generate_data'],
+    'extract': ['src.extract'],
+    'transform': ['src.extract', 'src.transform'],
+    'load': ['src.extract', 'src.transform', 'src.load', 'src.pipelining'],
+    'report': ['src.visualize'],
+    'all': ['src.extract', 'src.transform', 'src.load', 'src.pipelining', 'src.visualize']
+}
+
+def import_command(command):
+    start = time.perf_counter()
+    for name in COMMAND_MODULES[command]:
+        importlib.import_module(name)
+    return time.perf_counter() - start
+
+def _instrumented(name, instrumentation, run):
+    from src import instrument
+    
+    if instrumentation is not None:
+        instrument.activate(instrumentation)
+    try:
+        with instrument.stage(name):
+            return run()
+    finally:
+        instrument.deactivate()
+
+# every run_* function takes the parsed command-line options; parse_args supplies the defaults, so
+# run_pipeline() alone runs the whole pipeline as before
+def _extractor(options):
+    from src.extract import DataExtractor
+    
+    return DataExtractor(file_format=options.file_format, order_files=options.order_files,
+                         manifest=options.manifest, workers=options.extract_workers)
+
+def run_pipeline(options=None, instrumentation=None):
+    options = options or parse_args(['all'])
+    if options.pipelined and not options.chunksize:
+        raise ValueError("pipelined execution streams orders and needs a chunksize")
     print("="*50)
     print("E-COMMERCE ANALYTICS ETL PIPELINE")
     print("="*50)
     
-    extractor = DataExtractor()
-    raw_data = extractor.extract_all()
-    
-    transformer = DataTransformer()
-    clean_data = transformer.transform_all(raw_data)
-    
-    loader = DataLoader()
-    loader.load_all(clean_data)
-    
-    visualizer = DataVisualizer()
-    visualizer.run_all()
+    _instrumented('pipeline', instrumentation, lambda: _run_stages(options))
     
     print("\n" + "="*50)
     print("Pipeline completed successfully!")
     print("="*50)
 
+def _run_stages(options):
+    from src.transform import DataTransformer, TransformCache
+    from src.load import DataLoader
+    from src.instrument import stage
+    from src.pipelining import background
+    
+    chunksize, incremental, pipelined = options.chunksize, options.incremental, options.pipelined
+    loader = DataLoader(batch_size=options.batch_size, synchronous=options.synchronous,
+                        storage=options.storage, backend=options.backend, sketches=options.sketches,
+                        report_indexes=options.report_indexes)
+    after_order_id = loader.get_watermark()[0] if incremental else None
+    extractor = _extractor(options)
+    transformer = DataTransformer(workers=options.transform_workers, partition_by=options.partition_by)
+    
+    if options.transform_cache and not chunksize:
+        # unchanged input files skip both extraction and cleaning
+        with stage('transform'):
+            cache = TransformCache(max_bytes=options.transform_cache_mb * 1024 ** 2)
+            clean_data = transformer.transform_files(extractor, cache, after_order_id)
+    else:
+        # with --chunksize, extract and transform only build generators; the rows flow during load
+        with stage('extract'):
+            raw_data = extractor.extract_all(chunksize=chunksize, after_order_id=after_order_id)
+            if pipelined:
+                # chunk reads start now and overlap the shipping-cost pre-pass, transforms and inserts
+                raw_data['orders'] = background(raw_data['orders'], name='extract')
+        
+        with stage('transform'):
+            clean_data = transformer.transform_all(raw_data)
+    
+    if options.transformed_dir:
+        clean_data = transformer.save(clean_data, options.transformed_dir)
+    if pipelined:
+        clean_data['fact_sales'] = background(clean_data['fact_sales'], name='transform')
+    
+    with stage('load'):
+        try:
+            loader.load_all(clean_data, incremental=incremental)
+        finally:
+            if pipelined:
+                # a failed load leaves both queues undrained; stop the transform thread before the
+                # extract thread it reads from, or it would wait on the extract queue forever
+                clean_data['fact_sales'].close()
+                raw_data['orders'].close()
+        if pipelined:
+            print(raw_data['orders'].summary())
+            print(clean_data['fact_sales'].summary())
+    
+    if options.command == 'all':
+        _run_report(options)
+
+def _run_report(options):
+    from src.visualize import DataVisualizer
+    from src.instrument import stage
+    
+    with stage('visualize'):
+        visualizer = DataVisualizer(source=options.report_source, plotlyjs=options.plotlyjs,
+                                    workers=options.render_workers, dashboard=options.dashboard,
+                                    cache_dir='output/.cache' if options.report_cache else None,
+                                    backend=options.backend)
+        if options.explain:
+            visualizer.explain()
+        visualizer.run_all()
+
+def run_extract(options, instrumentation=None):
+    def extract():
+        data = _extractor(options).extract_all()
+        print(f"\nExtracted {len(data['customers'])} customers, {len(data['products'])} products, "
+              f"{len(data['orders'])} order lines")
+    
+    _instrumented('extract', instrumentation, extract)
+
+def run_transform(options, instrumentation=None):
+    from src.transform import DataTransformer, TransformCache
+    
+    if not options.transform_cache and not options.transformed_dir:
+        raise ValueError("transform without the cache needs --transformed-dir to keep its output")
+    
+    def transform():
+        extractor = _extractor(options)
+        transformer = DataTransformer(workers=options.transform_workers, partition_by=options.partition_by)
+        if options.transform_cache:
+            # a later load or all run with the same inputs reads these from the cache
+            cache = TransformCache(max_bytes=options.transform_cache_mb * 1024 ** 2)
+            clean_data = transformer.transform_files(extractor, cache)
+        else:
+            clean_data = transformer.transform_all(extractor.extract_all())
+        if options.transformed_dir:
+            transformer.save(clean_data, options.transformed_dir)
+    
+    _instrumented('transform', instrumentation, transform)
+
+def run_report(options, instrumentation=None):
+    _instrumented('report', instrumentation, lambda: _run_report(options))
+
+def _extract_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', dest='file_format',
+                        help="format of the input files in data/")
+    parser.add_argument('--order-files', nargs='+', default=None, metavar='PATTERN',
+                        help="read orders from every file matching these glob patterns under data/ "
+                             "(.csv, .csv.gz, .csv.zst or .parquet) instead of data/orders.<format>")
+    parser.add_argument('--manifest', default=None,
+                        help="file listing order files or patterns, one per line, relative to the manifest")
+    parser.add_argument('--extract-workers', type=int, default=1,
+                        help="read this many order files concurrently in a thread pool")
+    return parser
+
+def _transform_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--transformed-dir', default=None,
+                        help="also persist the transformed tables as Parquet in this directory")
+    parser.add_argument('--transform-workers', type=int, default=1,
+                        help="clean orders and build fact_sales in a process pool of this size")
+    parser.add_argument('--partition-by', choices=['month', 'customer'], default='month',
+                        help="how orders are split across transform workers when not streaming")
+    parser.add_argument('--no-transform-cache', dest='transform_cache', action='store_false',
+                        help="always re-extract and re-clean the inputs instead of reusing cached "
+                             "results for unchanged files")
+    parser.add_argument('--transform-cache-mb', type=int, default=2048,
+                        help="size budget of output/.cache/transform; least recently used entries are evicted")
+    return parser
+
+def _database_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--backend', choices=['sqlite', 'duckdb'], default='sqlite',
+                        help="database engine: SQLite (output/ecommerce.db) or the columnar DuckDB "
+                             "(output/ecommerce.duckdb)")
+    return parser
+
+def _load_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="stream orders through extract/transform/load in chunks of this many rows")
+    parser.add_argument('--incremental', action='store_true',
+                        help="append only orders above the stored high-water mark instead of rebuilding")
+    parser.add_argument('--batch-size', type=int, default=100_000,
+                        help="rows per executemany batch when loading into SQLite")
+    parser.add_argument('--synchronous', choices=['OFF', 'NORMAL'], default='OFF',
+                        help="SQLite synchronous mode used while bulk loading")
+    parser.add_argument('--storage', choices=['denormalized', 'star'], default='denormalized',
+                        help="store fact_sales with label columns, or as integer surrogate keys "
+                             "into small dimension tables")
+    parser.add_argument('--sketches', action='store_true',
+                        help="also keep mergeable HyperLogLog and KLL sketches per rollup group for "
+                             "approximate distinct counts and revenue percentiles")
+    parser.add_argument('--report-indexes', action='store_true',
+                        help="add covering indexes for the fact report queries and ANALYZE (SQLite)")
+    parser.add_argument('--pipelined', action='store_true',
+                        help="with --chunksize, run extract, transform and load concurrently "
+                             "connected by bounded queues")
+    return parser
+
+def _report_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--report-source', choices=['rollup', 'fact', 'scan', 'sketch'], default='rollup',
+                        help="read dashboards from the rollup tables, run one query per chart on "
+                             "fact_sales, compute every chart from a single fact_sales scan, or read "
+                             "distinct counts from the sketches (needs --sketches)")
+    parser.add_argument('--explain', action='store_true',
+                        help="print the query plan of every report query and flag full scans of fact_sales")
+    parser.add_argument('--plotlyjs', choices=['inline', 'directory', 'cdn'], default='inline',
+                        help="embed plotly.js in every chart, share one plotly.min.js in output/, or use the CDN")
+    parser.add_argument('--render-workers', type=int, default=1,
+                        help="render charts in a process pool of this size")
+    parser.add_argument('--dashboard', action='store_true',
+                        help="also write every chart into a single dashboard.html")
+    parser.add_argument('--no-report-cache', dest='report_cache', action='store_false',
+                        help="always re-run report queries and re-render every chart")
+    return parser
+
+def _metrics_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--metrics', default=None,
+                        help="append one JSON event per stage (time, rows, rows/sec, RSS) to this file")
+    parser.add_argument('--profile', default='',
+                        help="comma-separated stages to run under cProfile (or 'all'); "
+                             "profiles are written to output/profiles/")
+    parser.add_argument('--trace-memory', default='',
+                        help="comma-separated stages to run under tracemalloc (or 'all')")
+    return parser
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # a bare `python main.py [options]` still runs the whole pipeline
+    if not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help')):
+        argv.insert(0, 'all')
+    
+    parser = argparse.ArgumentParser(description="E-commerce analytics ETL pipeline")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.add_parser('generate', add_help=False,
+                        help="write sample data to data/ (sizes: --customers, --products, --orders; "
+                             "see `generate --help`)")
+    extract, transform, database = _extract_options(), _transform_options(), _database_options()
+    load, report, metrics = _load_options(), _report_options(), _metrics_options()
+    commands.add_parser('extract', parents=[extract, metrics],
+                        help="read the input files and report row counts")
+    commands.add_parser('transform', parents=[extract, transform, metrics],
+                        help="clean the inputs and build fact_sales into the transform cache")
+    commands.add_parser('load', parents=[extract, transform, database, load, metrics],
+                        help="extract, transform and load into the database without rendering reports")
+    commands.add_parser('report', parents=[database, report, metrics],
+                        help="render the dashboards from the loaded database")
+    commands.add_parser('all', parents=[extract, transform, database, load, report, metrics],
+                        help="run every stage (the default)")
+    
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'generate':
+        args.generate_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    return args
+
+def _instrumentation(args):
+    from src.instrument import Instrumentation
+    
+    profile = [name for name in args.profile.split(',') if name]
+    trace_memory = [name for name in args.trace_memory.split(',') if name]
+    if args.metrics or profile or trace_memory:
+        return Instrumentation(args.metrics, profile, trace_memory)
+    return None
+
+def main(argv=None):
+    args = parse_args(argv)
+    import_seconds = import_command(args.command)
+    if args.command == 'generate':
+        from src import generate_data
+        generate_data.main(args.generate_args)
+        return
+    
+    instrumentation = _instrumentation(args)
+    if instrumentation is not None:
+        instrumentation.emit({'event': 'startup', 'run_id': instrumentation.run_id, 'command': args.command,
+                              'import_seconds': import_seconds,
+                              'seconds': time.perf_counter() - STARTED})
+    
+    if args.command == 'extract':
+        run_extract(args, instrumentation)
+    elif args.command == 'transform':
+        run_transform(args, instrumentation)
+    elif args.command == 'report':
+        run_report(args, instrumentation)
+    else:
+        if args.pipelined and not args.chunksize:
+            args.chunksize = 500_000
+        run_pipeline(args, instrumentation)
+
 if __name__ == "__main__":
-    run_pipeline()
+    main()
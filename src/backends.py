@@ -0,0 +1,183 @@
+import sqlite3
+import pandas as pd
+import numpy as np
+from contextlib import contextmanager
+import re
+import os
+
+BACKENDS = ['sqlite', 'duckdb']
+
+DEFAULT_DB_PATHS = {
+    'sqlite': 'output/ecommerce.db',
+    'duckdb': 'output/ecommerce.duckdb'
+}
+
+def _sql_values(series):
+    if pd.api.types.is_datetime64_any_dtype(series) or isinstance(series.dtype, pd.PeriodDtype):
+        # format each distinct value once; dates repeat on every fact row
+        codes, uniques = pd.factorize(series)
+        if isinstance(series.dtype, pd.PeriodDtype):
+            labels = uniques.astype(str)
+        else:
+            labels = uniques.strftime('%Y-%m-%d %H:%M:%S')
+        labels = np.append(np.asarray(labels, dtype=object), None)
+        return labels[codes].tolist()
+    return series.tolist()
+
+def _period_labels(series):
+    # categorical labels scan as strings without formatting every row
+    codes, uniques = pd.factorize(series)
+    return pd.Categorical.from_codes(codes, uniques.astype(str))
+
+class SQLiteBackend:
+    name = 'sqlite'
+    supports_indexes = True
+    
+    def __init__(self, db_path, synchronous='OFF'):
+        self.db_path = db_path
+        self.synchronous = synchronous
+        self.conn = sqlite3.connect(db_path)
+    
+    def execute(self, sql, params=()):
+        return self.conn.execute(sql, params)
+    
+    def executemany(self, sql, rows):
+        return self.conn.executemany(sql, rows)
+    
+    def tables(self):
+        return {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    
+    def read_sql(self, query, chunksize=None):
+        return pd.read_sql_query(query, self.conn, chunksize=chunksize)
+    
+    def explain(self, query):
+        return [row[3] for row in self.conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+    
+    def insert(self, table, columns, chunks, batch_size, on_conflict=''):
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) {on_conflict}"
+        total = 0
+        for df in chunks:
+            for start in range(0, len(df), batch_size):
+                batch = df.iloc[start:start + batch_size]
+                self.conn.executemany(sql, zip(*(_sql_values(batch[c]) for c in columns)))
+            total += len(df)
+        return total
+    
+    @contextmanager
+    def bulk_load_settings(self):
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-262144")
+        try:
+            yield
+        finally:
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+    
+    @contextmanager
+    def transaction(self):
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+    
+    def commit(self):
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.close()
+
+class DuckDBBackend:
+    name = 'duckdb'
+    # DuckDB scans with zone maps; ART indexes would only slow down loads and upserts
+    supports_indexes = False
+    
+    # the schema is written with SQLite affinities; DuckDB's INTEGER and REAL are 32-bit
+    TYPE_MAP = {'INTEGER': 'BIGINT', 'REAL': 'DOUBLE', 'DATE': 'TIMESTAMP'}
+    
+    def __init__(self, db_path, synchronous='OFF'):
+        import duckdb
+        
+        self.db_path = db_path
+        self.conn = duckdb.connect(db_path)
+    
+    def execute(self, sql, params=()):
+        if sql.lstrip().upper().startswith('CREATE TABLE'):
+            sql = re.sub(r'\b(INTEGER|REAL|DATE)\b', lambda m: self.TYPE_MAP[m.group(1)], sql)
+        return self.conn.execute(sql, params)
+    
+    def executemany(self, sql, rows):
+        return self.conn.executemany(sql, [list(row) for row in rows])
+    
+    def tables(self):
+        return {row[0] for row in self.conn.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+    
+    def read_sql(self, query, chunksize=None):
+        if chunksize is None:
+            return self.conn.execute(query).df()
+        return self._read_batches(query, chunksize)
+    
+    def explain(self, query):
+        rows = self.conn.execute(f"EXPLAIN {query}").fetchall()
+        return [line for _, plan in rows for line in plan.splitlines() if line.strip()]
+    
+    def _read_batches(self, query, chunksize):
+        reader = self.conn.execute(query).fetch_record_batch(chunksize)
+        for batch in reader:
+            yield batch.to_pandas()
+    
+    def insert(self, table, columns, chunks, batch_size, on_conflict=''):
+        # the frame is scanned in place through a registered view instead of binding rows one by one
+        total = 0
+        for df in chunks:
+            frame = df[columns]
+            periods = [c for c in columns if isinstance(frame[c].dtype, pd.PeriodDtype)]
+            if periods:
+                frame = frame.assign(**{c: _period_labels(frame[c]) for c in periods})
+            self.conn.register('_load_frame', frame)
+            try:
+                self.conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) "
+                                  f"SELECT {', '.join(columns)} FROM _load_frame {on_conflict}")
+            finally:
+                self.conn.unregister('_load_frame')
+            total += len(df)
+        return total
+    
+    @contextmanager
+    def bulk_load_settings(self):
+        self.conn.execute("SET preserve_insertion_order = false")
+        try:
+            yield
+        finally:
+            self.conn.execute("SET preserve_insertion_order = true")
+    
+    @contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+    
+    def commit(self):
+        # statements outside transaction() autocommit
+        pass
+    
+    def close(self):
+        self.conn.close()
+
+def connect(backend='sqlite', db_path=None, synchronous='OFF'):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported backend: {backend}")
+    db_path = db_path or DEFAULT_DB_PATHS[backend]
+    if os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    cls = DuckDBBackend if backend == 'duckdb' else SQLiteBackend
+    return cls(db_path, synchronous=synchronous)
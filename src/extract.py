@@ -1,35 +1,299 @@
 import pandas as pd
 import os
+import glob
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+try:
+    from instrument import stage
+    from pipelining import background
+except ImportError:
+    from src.instrument import stage
+    from src.pipelining import background
+
+ORDER_STATUSES = ['Completed', 'Pending', 'Cancelled', 'Returned']
+
+# status is read as a plain category and only cast to the fixed set once every value is known, since
+# the cast itself would turn unknown values into NaN
+STATUS_DTYPE = pd.CategoricalDtype(ORDER_STATUSES)
+
+ORDER_DTYPES = {
+    'order_id': 'int64',
+    'customer_id': 'int64',
+    'product_id': 'int64',
+    'quantity': 'int64',
+    'unit_price': 'float64',
+    'total_amount': 'float64',
+    'status': 'category',
+    'shipping_cost': 'float64'
+}
+
+# columns the transform and load stages actually use; everything else is never read
+CUSTOMER_COLUMNS = ['customer_id', 'customer_name', 'email', 'registration_date',
+                    'country', 'customer_segment']
+PRODUCT_COLUMNS = ['product_id', 'product_name', 'category', 'base_price', 'cost']
+ORDER_COLUMNS = ['order_id', 'customer_id', 'product_id', 'order_date', 'quantity',
+                 'unit_price', 'total_amount', 'status', 'shipping_cost']
+
+FILE_FORMATS = ['csv', 'parquet']
+
+# compressed CSV inputs are recognised by extension and decompressed while they are parsed
+COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+def file_format_of(path):
+    return 'parquet' if '.parquet' in os.path.basename(path) else 'csv'
+
+def _csv_source(path):
+    compression = COMPRESSIONS.get(os.path.splitext(path)[1])
+    if compression is None:
+        return nullcontext(path)
+    # pyarrow ships both codecs, so zstd needs no extra package
+    import pyarrow as pa
+    
+    return pa.input_stream(path, compression=compression)
+
+def file_columns(path):
+    if file_format_of(path) == 'parquet':
+        if os.path.splitext(path)[1] in COMPRESSIONS:
+            raise ValueError(f"{path}: Parquet files are compressed internally; use an uncompressed .parquet file")
+        import pyarrow.parquet as pq
+        
+        return pq.read_schema(path).names
+    with _csv_source(path) as source:
+        return list(pd.read_csv(source, nrows=0).columns)
+
+def validate_schema(path, columns):
+    # checked for every file before any is read, so a bad drop fails the run before anything loads
+    missing = [c for c in columns if c not in file_columns(path)]
+    if missing:
+        raise ValueError(f"{path} is missing columns: {', '.join(missing)}")
+
+def check_statuses(path, df):
+    if 'status' not in df.columns:
+        return df
+    unknown = sorted(set(df['status'].dropna().unique()) - set(ORDER_STATUSES))
+    if unknown:
+        raise ValueError(f"{path} has unknown order statuses: {', '.join(map(str, unknown))}")
+    return df.assign(status=df['status'].astype(STATUS_DTYPE))
+
+def _parquet_rows(path):
+    import pyarrow.parquet as pq
+    
+    return pq.read_metadata(path).num_rows
+
+# rows at or below the watermark are dropped while reading; when `skipped` is given, it receives
+# (rows dropped, rows kept) per path so the extractor can report them
+def read_file(path, columns, dtypes=None, parse_dates=None, after_order_id=None, skipped=None):
+    try:
+        if file_format_of(path) == 'parquet':
+            filters = None if after_order_id is None else [('order_id', '>', after_order_id)]
+            df = pd.read_parquet(path, columns=columns, filters=filters)
+            if dtypes:
+                df = df.astype(dtypes)
+            total = len(df) if after_order_id is None else _parquet_rows(path)
+        else:
+            with _csv_source(path) as source:
+                df = pd.read_csv(source, usecols=columns, dtype=dtypes, parse_dates=parse_dates)
+            total = len(df)
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"{path}: {exc}") from exc
+    if after_order_id is not None:
+        df = df[df['order_id'] > after_order_id]
+        if skipped is not None:
+            skipped[path] = (total - len(df), len(df))
+    return check_statuses(path, df)
+
+def read_file_chunks(path, columns, chunksize, dtypes, parse_dates, after_order_id=None, skipped=None):
+    if file_format_of(path) == 'parquet':
+        import pyarrow.dataset as ds
+        
+        # the filter lets pyarrow skip whole row groups using their min/max statistics
+        row_filter = None if after_order_id is None else ds.field('order_id') > after_order_id
+        dataset = ds.dataset(path, format='parquet')
+        kept = 0
+        for batch in dataset.to_batches(columns=columns, filter=row_filter, batch_size=chunksize):
+            if batch.num_rows:
+                kept += batch.num_rows
+                yield check_statuses(path, batch.to_pandas().astype(dtypes))
+        if after_order_id is not None and skipped is not None:
+            skipped[path] = (_parquet_rows(path) - kept, kept)
+        return
+    
+    total = kept = 0
+    with _csv_source(path) as source, pd.read_csv(source, usecols=columns, dtype=dtypes,
+                                                  parse_dates=parse_dates, chunksize=chunksize) as reader:
+        for chunk in reader:
+            total += len(chunk)
+            if after_order_id is not None:
+                chunk = chunk[chunk['order_id'] > after_order_id]
+            kept += len(chunk)
+            yield check_statuses(path, chunk)
+    if after_order_id is not None and skipped is not None:
+        skipped[path] = (total - kept, kept)
+
+def read_manifest(path):
+    # one file or glob pattern per line, relative to the manifest; blank lines and # comments are skipped
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        lines = [line.split('#', 1)[0].strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line]
 
 class DataExtractor:
-    def __init__(self, data_dir='data'):
+    def __init__(self, data_dir='data', file_format='csv', order_files=None, manifest=None, workers=1,
+                 read_ahead=2):
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"Unsupported file format: {file_format}")
         self.data_dir = data_dir
+        self.file_format = file_format
+        # glob patterns under data_dir for many order drops; the default is the single orders file
+        self.order_patterns = list(order_files or [])
+        if manifest:
+            self.order_patterns += read_manifest(manifest)
+        self.workers = workers
+        # chunks each concurrently read file may buffer before its reader waits for the consumer
+        self.read_ahead = read_ahead
+        # (rows dropped by the watermark, rows kept) per order file of the current extraction
+        self.skipped = {}
         
+    def _path(self, name):
+        path = os.path.join(self.data_dir, f'{name}.{self.file_format}')
+        if not os.path.exists(path):
+            for ext in COMPRESSIONS:
+                if os.path.exists(path + ext):
+                    return path + ext
+        return path
+    
+    def input_files(self, name):
+        if name != 'orders' or not self.order_patterns:
+            return [self._path(name)]
+        files = []
+        for pattern in self.order_patterns:
+            # absolute patterns, including manifest entries, ignore data_dir
+            matches = sorted(glob.glob(os.path.join(self.data_dir, pattern)))
+            if not matches:
+                raise FileNotFoundError(f"No order files match {pattern}")
+            files += [path for path in matches if path not in files]
+        return files
+    
+    def _read(self, name, columns):
+        path = self._path(name)
+        validate_schema(path, columns)
+        return read_file(path, columns)
+    
     def extract_customers(self):
-        path = os.path.join(self.data_dir, 'customers.csv')
-        df = pd.read_csv(path)
+        df = self._read('customers', CUSTOMER_COLUMNS)
         print(f"Extracted {len(df)} customers")
         return df
     
     def extract_products(self):
-        path = os.path.join(self.data_dir, 'products.csv')
-        df = pd.read_csv(path)
+        df = self._read('products', PRODUCT_COLUMNS)
         print(f"Extracted {len(df)} products")
         return df
     
-    def extract_orders(self):
-        path = os.path.join(self.data_dir, 'orders.csv')
-        df = pd.read_csv(path, parse_dates=['order_date'])
-        print(f"Extracted {len(df)} orders")
+    def _order_files(self, columns):
+        files = self.input_files('orders')
+        for path in files:
+            validate_schema(path, columns)
+        return files
+    
+    def report_skipped(self, after_order_id):
+        # the default orders file grows between loads, so its older rows are expected. Listed drops
+        # entirely at or below the watermark were loaded before; a drop that also brings new rows
+        # overlaps an earlier load, and its older rows are lost since the watermark cannot tell them apart
+        counts, self.skipped = self.skipped, {}
+        below = sum(dropped for dropped, _ in counts.values())
+        if not below:
+            return
+        old = sum(1 for dropped, kept in counts.values() if dropped and not kept)
+        print(f"Skipped {below} order lines at or below order_id {after_order_id}"
+              + (f" ({old} files entirely)" if old else ""))
+        for path, (dropped, kept) in counts.items():
+            if dropped and kept and self.order_patterns:
+                print(f"  Warning: {path} has {dropped} lines at or below order_id {after_order_id} "
+                      f"next to {kept} new ones; the older lines were not loaded")
+    
+    def extract_orders(self, after_order_id=None):
+        files = self._order_files(ORDER_COLUMNS)
+        read = lambda path: read_file(path, ORDER_COLUMNS, ORDER_DTYPES, ['order_date'], after_order_id,
+                                      self.skipped)
+        if self.workers > 1 and len(files) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                frames = list(pool.map(read, files))
+        else:
+            frames = [read(path) for path in files]
+        df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        print(f"Extracted {len(df)} orders" + (f" from {len(files)} files" if len(files) > 1 else ""))
+        self.report_skipped(after_order_id)
         return df
     
-    def extract_all(self):
+    def _read_chunks(self, files, columns, chunksize, dtypes, parse_dates, after_order_id=None):
+        read = lambda path: read_file_chunks(path, columns, chunksize, dtypes, parse_dates, after_order_id,
+                                             self.skipped)
+        if self.workers <= 1 or len(files) <= 1:
+            for path in files:
+                yield from read(path)
+            return
+        
+        # up to `workers` files are read at once, each in its own thread that stays at most
+        # `read_ahead` chunks ahead; chunks are handed on in file order
+        pending = deque()
+        remaining = iter(files)
+        try:
+            for path in remaining:
+                pending.append(background(read(path), maxsize=self.read_ahead, name=path))
+                if len(pending) == self.workers:
+                    break
+            while pending:
+                yield from pending[0]
+                pending.popleft()
+                path = next(remaining, None)
+                if path is not None:
+                    pending.append(background(read(path), maxsize=self.read_ahead, name=path))
+        finally:
+            for reader in pending:
+                reader.close()
+    
+    def extract_orders_chunks(self, chunksize=500_000, columns=None, after_order_id=None, report=True):
+        columns = columns or ORDER_COLUMNS
+        read_columns = columns
+        if after_order_id is not None and 'order_id' not in columns:
+            read_columns = ['order_id'] + columns
+        dtypes = {c: t for c, t in ORDER_DTYPES.items() if c in read_columns}
+        parse_dates = [c for c in ['order_date'] if c in read_columns]
+        
+        total = 0
+        files = self._order_files(read_columns)
+        for chunk in self._read_chunks(files, read_columns, chunksize, dtypes, parse_dates, after_order_id):
+            total += len(chunk)
+            yield chunk[columns] if read_columns is not columns else chunk
+        if report and columns == ORDER_COLUMNS:
+            print(f"Extracted {total} orders")
+            self.report_skipped(after_order_id)
+    
+    def extract_all(self, chunksize=None, after_order_id=None):
         print("\n--- EXTRACT ---")
-        return {
-            'customers': self.extract_customers(),
-            'products': self.extract_products(),
-            'orders': self.extract_orders()
-        }
+        data = {}
+        with stage('customers') as s:
+            data['customers'] = self.extract_customers()
+            s['rows_out'] = len(data['customers'])
+        with stage('products') as s:
+            data['products'] = self.extract_products()
+            s['rows_out'] = len(data['products'])
+        if after_order_id is not None:
+            print(f"Extracting orders after order_id {after_order_id}")
+        if chunksize:
+            print(f"Streaming orders in chunks of {chunksize:,} rows")
+            data['orders'] = self.extract_orders_chunks(chunksize, after_order_id=after_order_id)
+            # a first pass for the shipping-cost median; it reads every order column so duplicates
+            # are dropped exactly as in the main pass
+            data['shipping_costs'] = self.extract_orders_chunks(chunksize, after_order_id=after_order_id,
+                                                                report=False)
+        else:
+            with stage('orders') as s:
+                data['orders'] = self.extract_orders(after_order_id)
+                s['rows_out'] = len(data['orders'])
+        return data
 
 if __name__ == "__main__":
     extractor = DataExtractor()
@@ -1,14 +1,25 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import argparse
 import random
+import os
 
-np.random.seed(42)
-random.seed(42)
+SEED = 42
+
+np.random.seed(SEED)
+random.seed(SEED)
 
 NUM_CUSTOMERS = 500
 NUM_PRODUCTS = 50
 NUM_ORDERS = 2000
+CHUNK_SIZE = 1_000_000
+BLOCK_SIZE = 100_000
+NUM_MISSING_SHIPPING = 20
+NUM_DUPLICATES = 10
+
+STATUSES = ['Completed', 'Pending', 'Cancelled', 'Returned']
+STATUS_PROBS = [0.85, 0.05, 0.05, 0.05]
 
 def generate_customers(n):
     start_date = datetime(2024, 1, 1)
@@ -33,51 +44,154 @@ def generate_products(n):
     })
     return products
 
-def generate_orders(num_orders, customers, products):
-    orders = []
+def generate_orders(num_orders, customers, products, first_order_id=1, rng=np.random):
     start_date = datetime(2024, 1, 1)
     end_date = datetime(2024, 10, 31)
     days = (end_date - start_date).days
-    
-    for order_id in range(1, num_orders + 1):
-        customer_id = random.randint(1, len(customers))
-        order_date = start_date + timedelta(days=random.randint(0, days))
-        num_items = random.randint(1, 5)
-        
-        for item in range(num_items):
-            product_id = random.randint(1, len(products))
-            product = products[products['product_id'] == product_id].iloc[0]
-            quantity = random.randint(1, 3)
-            price = product['base_price'] * random.uniform(0.9, 1.1)
-            status = np.random.choice(['Completed', 'Pending', 'Cancelled', 'Returned'], p=[0.85, 0.05, 0.05, 0.05])
-            
-            orders.append({
-                'order_id': order_id,
-                'customer_id': customer_id,
-                'product_id': product_id,
-                'order_date': order_date,
-                'quantity': quantity,
-                'unit_price': round(price, 2),
-                'total_amount': round(price * quantity, 2),
-                'status': status,
-                'shipping_cost': round(random.uniform(5, 25), 2) if item == 0 else 0
-            })
-    
-    return pd.DataFrame(orders)
 
-if __name__ == '__main__':
+    # one draw per order
+    order_ids = np.arange(first_order_id, first_order_id + num_orders, dtype=np.int64)
+    customer_ids = rng.randint(1, len(customers) + 1, num_orders)
+    day_offsets = rng.randint(0, days + 1, num_orders)
+    num_items = rng.randint(1, 6, num_orders)
+
+    # one draw per line item; items of an order are contiguous
+    n = int(num_items.sum())
+    order_idx = np.repeat(np.arange(num_orders), num_items)
+    first_item = np.zeros(n, dtype=bool)
+    first_item[np.cumsum(num_items) - num_items] = True
+
+    product_ids = rng.randint(1, len(products) + 1, n)
+    base_prices = products.set_index('product_id')['base_price'].reindex(np.arange(1, len(products) + 1)).to_numpy()
+    quantity = rng.randint(1, 4, n)
+    price = base_prices[product_ids - 1] * rng.uniform(0.9, 1.1, n)
+    status = np.asarray(STATUSES)[rng.choice(len(STATUSES), n, p=STATUS_PROBS)]
+    shipping = np.where(first_item, rng.uniform(5, 25, n).round(2), 0.0)
+
+    return pd.DataFrame({
+        'order_id': order_ids[order_idx],
+        'customer_id': customer_ids[order_idx],
+        'product_id': product_ids,
+        'order_date': pd.Timestamp(start_date) + pd.to_timedelta(day_offsets[order_idx], unit='D'),
+        'quantity': quantity,
+        'unit_price': price.round(2),
+        'total_amount': (price * quantity).round(2),
+        'status': status,
+        'shipping_cost': shipping
+    })
+
+def _rng(seed, *key):
+    # independent streams derived from one seed, as SeedSequence(seed).spawn would give
+    return np.random.RandomState(np.random.MT19937(np.random.SeedSequence(seed, spawn_key=key)))
+
+def generate_orders_blocks(num_orders, customers, products, seed=SEED,
+                           num_missing=NUM_MISSING_SHIPPING, num_duplicates=NUM_DUPLICATES):
+    # orders are generated in fixed blocks, each seeded from its own index, so a seed gives the same
+    # dataset whatever chunk size it is written with
+    sizes = np.diff(np.append(np.arange(0, num_orders, BLOCK_SIZE), num_orders))
+    weights = sizes / sizes.sum()
+    issues = _rng(seed, 0)
+    missing_per_block = issues.multinomial(num_missing, weights)
+    dups_per_block = issues.multinomial(num_duplicates, weights)
+
+    for i, start in enumerate(range(0, num_orders, BLOCK_SIZE)):
+        rng = _rng(seed, 1, i)
+        block = generate_orders(int(sizes[i]), customers, products, first_order_id=start + 1, rng=rng)
+        if missing_per_block[i]:
+            rows = rng.choice(len(block), min(missing_per_block[i], len(block)), replace=False)
+            block.loc[rows, 'shipping_cost'] = np.nan
+        dups = None
+        if dups_per_block[i]:
+            dups = block.iloc[rng.choice(len(block), dups_per_block[i], replace=False)]
+        yield block, dups
+
+def _write_parquet_chunk(writer, path, df):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if writer is None:
+        writer = pq.ParquetWriter(path, table.schema)
+    writer.write_table(table)
+    return writer
+
+def write_table(df, path, file_format='csv'):
+    if file_format == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+def write_orders(path, num_orders, customers, products, chunk_size=CHUNK_SIZE,
+                 num_missing=NUM_MISSING_SHIPPING, num_duplicates=NUM_DUPLICATES,
+                 file_format='csv', seed=SEED):
+    writer = None
+    written = 0
+
+    def write(df):
+        nonlocal writer, written
+        if file_format == 'parquet':
+            writer = _write_parquet_chunk(writer, path, df)
+        else:
+            df.to_csv(path, mode='w' if written == 0 else 'a', header=(written == 0), index=False)
+        written += len(df)
+
+    # chunk_size only sets how many orders are buffered per write; pieces of consecutive blocks
+    # that fall into the same chunk are written together
+    duplicates = []
+    pending, pending_key = [], None
+    blocks = generate_orders_blocks(num_orders, customers, products, seed, num_missing, num_duplicates)
+    for block, dups in blocks:
+        if dups is not None:
+            duplicates.append(dups)
+        keys = (block['order_id'].to_numpy() - 1) // chunk_size
+        for key, piece in block.groupby(keys, sort=False):
+            if key != pending_key and pending:
+                write(pd.concat(pending, ignore_index=True))
+                pending = []
+            pending_key = key
+            pending.append(piece)
+    if pending:
+        write(pd.concat(pending, ignore_index=True))
+
+    if duplicates:
+        write(pd.concat(duplicates, ignore_index=True))
+
+    if writer is not None:
+        writer.close()
+    return written
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate sample e-commerce data")
+    parser.add_argument('--customers', type=int, default=NUM_CUSTOMERS)
+    parser.add_argument('--products', type=int, default=NUM_PRODUCTS)
+    parser.add_argument('--orders', type=int, default=NUM_ORDERS)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="orders written per chunk; the data itself does not depend on it")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output-dir', default='data')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', dest='file_format',
+                        help="parquet stores typed columns so extraction skips CSV and date parsing")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    np.random.seed(args.seed)
+    random.seed(args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+
     print("Generating data...")
-    
-    customers = generate_customers(NUM_CUSTOMERS)
-    products = generate_products(NUM_PRODUCTS)
-    orders = generate_orders(NUM_ORDERS, customers, products)
-    
-    orders.loc[random.sample(range(len(orders)), 20), 'shipping_cost'] = np.nan
-    duplicate_orders = orders.sample(10)
-    orders = pd.concat([orders, duplicate_orders], ignore_index=True)
-    
-    customers.to_csv('data/customers.csv', index=False)
-    products.to_csv('data/products.csv', index=False)
-    orders.to_csv('data/orders.csv', index=False)
-    
-    print(f"Created {len(customers)} customers, {len(products)} products, {len(orders)} orders")
+
+    customers = generate_customers(args.customers)
+    products = generate_products(args.products)
+
+    ext = args.file_format
+    write_table(customers, os.path.join(args.output_dir, f'customers.{ext}'), ext)
+    write_table(products, os.path.join(args.output_dir, f'products.{ext}'), ext)
+    num_rows = write_orders(os.path.join(args.output_dir, f'orders.{ext}'), args.orders,
+                            customers, products, chunk_size=args.chunk_size, file_format=ext,
+                            seed=args.seed)
+
+    print(f"Created {len(customers)} customers, {len(products)} products, {num_rows} orders")
+
+if __name__ == '__main__':
+    main()
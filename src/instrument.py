@@ -0,0 +1,132 @@
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError):
+        return None
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+# times nested pipeline stages and writes one JSON event per stage. profile and trace_memory
+# name the stages (or 'all') that also run under cProfile / tracemalloc.
+class Instrumentation:
+    def __init__(self, metrics_path=None, profile=(), trace_memory=(), profile_dir='output/profiles'):
+        self.metrics_path = metrics_path
+        self.profile = set(profile)
+        self.trace_memory = set(trace_memory)
+        self.profile_dir = profile_dir
+        self.run_id = uuid.uuid4().hex[:12]
+        self.events = []
+        self._stack = []
+        self._profiling = False
+        self._pid = os.getpid()
+        self._file = None
+        if metrics_path:
+            if os.path.dirname(metrics_path):
+                os.makedirs(os.path.dirname(metrics_path), exist_ok=True)
+            self._file = open(metrics_path, 'a')
+    
+    def _selected(self, names, name):
+        # a name matches the full dotted stage name or any dotted suffix of it, e.g. load_table.fact_sales
+        return 'all' in names or any(name == n or name.endswith('.' + n) for n in names)
+    
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        self._stack.append(name)
+        full_name = '.'.join(self._stack)
+        record = {'event': 'stage', 'run_id': self.run_id, 'stage': full_name}
+        if rows_in is not None:
+            record['rows_in'] = rows_in
+        
+        profiler = None
+        if self._selected(self.profile, full_name) and not self._profiling:
+            profiler = cProfile.Profile()
+            self._profiling = True
+        tracing = self._selected(self.trace_memory, full_name) and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        
+        record['started_at'] = time.time()
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record['seconds'] = time.perf_counter() - start
+            self._stack.pop()
+            
+            if tracing:
+                record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+                tracemalloc.stop()
+            if profiler:
+                self._profiling = False
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record['profile'] = os.path.join(self.profile_dir, f'{full_name}.prof')
+                profiler.dump_stats(record['profile'])
+            self._finish(record)
+    
+    def _finish(self, record):
+        rows = record.get('rows_out', record.get('rows_in'))
+        if rows:
+            record['rows_per_sec'] = rows / max(record['seconds'], 1e-9)
+        record['rss_mb'] = rss_mb()
+        record['peak_rss_mb'] = peak_rss_mb()
+        self.emit(record)
+    
+    def emit(self, record):
+        # forked workers inherit the active instance; only the owning process writes
+        if os.getpid() != self._pid:
+            return
+        self.events.append(record)
+        if self._file:
+            self._file.write(json.dumps(record, default=str) + '\n')
+            self._file.flush()
+    
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+_active = None
+
+def activate(instrumentation):
+    global _active
+    _active = instrumentation
+    return instrumentation
+
+def deactivate():
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = None
+
+@contextmanager
+def stage(name, rows_in=None):
+    # a plain dict when nothing is active, so the default run pays for no timing or I/O
+    if _active is None:
+        yield {}
+        return
+    with _active.stage(name, rows_in) as record:
+        yield record
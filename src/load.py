@@ -1,24 +1,154 @@
-import sqlite3
 import pandas as pd
+import numpy as np
 from datetime import datetime
-import os
+import time
+import uuid
+
+try:
+    from backends import connect
+    from instrument import stage
+    from sketches import SKETCH_METRICS, SKETCH_ROLLUPS, SKETCH_TYPES, hash_values, load_sketch
+except ImportError:
+    from src.backends import connect
+    from src.instrument import stage
+    from src.sketches import SKETCH_METRICS, SKETCH_ROLLUPS, SKETCH_TYPES, hash_values, load_sketch
+
+FACT_COLUMNS = ['order_id', 'customer_id', 'product_id', 'order_date', 'order_month',
+                'order_year', 'order_quarter', 'day_of_week', 'quantity', 'unit_price',
+                'total_amount', 'shipping_cost', 'total_order_value', 'status', 'category',
+                'customer_segment', 'country', 'price_tier', 'revenue', 'cost_of_goods',
+                'gross_profit']
+
+# normalized layout: integer keys and measures only, labels live in small dimension tables
+STAR_FACT_COLUMNS = ['order_id', 'customer_id', 'product_id', 'date_key', 'status_key',
+                     'category_key', 'segment_key', 'country_key', 'price_tier_key', 'quantity',
+                     'unit_price', 'total_amount', 'shipping_cost', 'total_order_value', 'revenue',
+                     'cost_of_goods', 'gross_profit']
+
+# fact column -> (dimension table, surrogate key column)
+STAR_DIMENSIONS = {
+    'status': ('dim_status', 'status_key'),
+    'category': ('dim_category', 'category_key'),
+    'customer_segment': ('dim_segment', 'segment_key'),
+    'country': ('dim_country', 'country_key'),
+    'price_tier': ('dim_price_tier', 'price_tier_key')
+}
+
+STORAGE_LAYOUTS = ['denormalized', 'star']
+
+CUSTOMER_COLUMNS = ['customer_id', 'customer_name', 'email', 'registration_date',
+                    'country', 'customer_segment', 'days_since_registration']
+
+PRODUCT_COLUMNS = ['product_id', 'product_name', 'category', 'base_price',
+                   'cost', 'profit_margin', 'price_tier']
+
+BATCH_SIZE = 100_000
+
+# completed-order rollups read by the dashboards, keyed by their group columns
+ROLLUPS = {
+    'agg_monthly': ['order_month'],
+    'agg_category': ['category'],
+    'agg_segment': ['customer_segment'],
+    'agg_country': ['country'],
+    'agg_product': ['product_id'],
+    'agg_customer': ['customer_segment', 'customer_id']
+}
+
+ROLLUP_MEASURES = ['total_revenue', 'total_profit', 'units_sold', 'order_count']
+
+# group label of order lines whose customer or product is missing from the dimensions. Rollup keys
+# are primary keys: DuckDB makes them NOT NULL, and SQLite never matches NULL keys on conflict, so
+# every incremental run would add another NULL row.
+UNKNOWN_LABEL = 'Unknown'
+
+ROLLUP_KEY_TYPES = {
+    'order_month': 'TEXT',
+    'category': 'TEXT',
+    'customer_segment': 'TEXT',
+    'country': 'TEXT',
+    'product_id': 'INTEGER',
+    'customer_id': 'INTEGER'
+}
+
+# covering indexes for the fact report queries in visualize.py: name -> (columns, partial index filter).
+# The denormalized ones hold only completed orders and end with status so SQLite can answer from the
+# index alone; the star status key is only known once loaded, so those lead with status_key instead.
+REPORT_INDEXES = {
+    'denormalized': {
+        'idx_report_month': ('order_month, revenue, gross_profit, status', "status = 'Completed'"),
+        'idx_report_category': ('category, revenue, gross_profit, status', "status = 'Completed'"),
+        'idx_report_segment': ('customer_segment, customer_id, revenue, status', "status = 'Completed'"),
+        'idx_report_product': ('product_id, revenue, quantity, status', "status = 'Completed'"),
+        'idx_report_country': ('country, revenue, status', "status = 'Completed'"),
+        'idx_report_summary': ('customer_id, product_id, revenue, gross_profit, status', "status = 'Completed'")
+    },
+    'star': {
+        'idx_report_date': ('status_key, date_key, revenue, gross_profit', None),
+        'idx_report_category': ('status_key, category_key, revenue, gross_profit', None),
+        'idx_report_segment': ('status_key, segment_key, customer_id, revenue', None),
+        'idx_report_product': ('status_key, product_id, revenue, quantity', None),
+        'idx_report_country': ('status_key, country_key, revenue', None),
+        'idx_report_summary': ('status_key, customer_id, product_id, revenue, gross_profit', None)
+    }
+}
+
+# completed fact rows with the columns the sketches are built from, for backfilling an existing database
+SKETCH_SOURCE_QUERIES = {
+    'denormalized': """
+        SELECT customer_segment, category, country, customer_id, product_id, revenue
+        FROM fact_sales
+        WHERE status = 'Completed'
+    """,
+    'star': """
+        SELECT s.customer_segment, c.category, n.country, f.customer_id, f.product_id, f.revenue
+        FROM fact_sales f
+        LEFT JOIN dim_segment s ON f.segment_key = s.segment_key
+        LEFT JOIN dim_category c ON f.category_key = c.category_key
+        LEFT JOIN dim_country n ON f.country_key = n.country_key
+        WHERE f.status_key = (SELECT status_key FROM dim_status WHERE status = 'Completed')
+    """
+}
+
+def known_labels(series):
+    if not series.hasnans:
+        return series
+    if isinstance(series.dtype, pd.CategoricalDtype) and UNKNOWN_LABEL not in series.cat.categories:
+        series = series.cat.add_categories([UNKNOWN_LABEL])
+    return series.fillna(UNKNOWN_LABEL)
+
+def _rollup_key(key):
+    return key if ROLLUP_KEY_TYPES[key] != 'TEXT' else f"COALESCE({key}, '{UNKNOWN_LABEL}')"
 
 class DataLoader:
-    def __init__(self, db_path='output/ecommerce.db'):
-        self.db_path = db_path
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        self.conn = sqlite3.connect(db_path)
+    def __init__(self, db_path=None, batch_size=BATCH_SIZE, synchronous='OFF',
+                 storage='denormalized', backend='sqlite', sketches=False, report_indexes=False):
+        if storage not in STORAGE_LAYOUTS:
+            raise ValueError(f"Unsupported storage layout: {storage}")
+        self.batch_size = batch_size
+        self.synchronous = synchronous
+        self.storage = storage
+        self.sketches = sketches
+        self.report_indexes = report_indexes
+        self.fact_columns = STAR_FACT_COLUMNS if storage == 'star' else FACT_COLUMNS
+        self._rollup_deltas = {}
+        self._sketch_deltas = {}
+        self._dim_keys = {}
+        self.db = connect(backend, db_path, synchronous)
+        self.db_path = self.db.db_path
         
-    def create_schema(self):
-        print("\nCreating database schema...")
-        cur = self.conn.cursor()
+    def create_schema(self, drop=True):
+        print("\nCreating database schema..." if drop else "\nChecking database schema...")
         
-        cur.execute("DROP TABLE IF EXISTS dim_customers")
-        cur.execute("DROP TABLE IF EXISTS dim_products")
-        cur.execute("DROP TABLE IF EXISTS fact_sales")
+        if drop:
+            self.db.execute("DROP TABLE IF EXISTS dim_customers")
+            self.db.execute("DROP TABLE IF EXISTS dim_products")
+            self.db.execute("DROP TABLE IF EXISTS fact_sales")
+            self.db.execute("DROP TABLE IF EXISTS dim_date")
+            for table, _ in STAR_DIMENSIONS.values():
+                self.db.execute(f"DROP TABLE IF EXISTS {table}")
         
-        cur.execute("""
-            CREATE TABLE dim_customers (
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS dim_customers (
                 customer_id INTEGER PRIMARY KEY,
                 customer_name TEXT,
                 email TEXT,
@@ -29,8 +159,8 @@ class DataLoader:
             )
         """)
         
-        cur.execute("""
-            CREATE TABLE dim_products (
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS dim_products (
                 product_id INTEGER PRIMARY KEY,
                 product_name TEXT,
                 category TEXT,
@@ -41,8 +171,19 @@ class DataLoader:
             )
         """)
         
-        cur.execute("""
-            CREATE TABLE fact_sales (
+        if self.storage == 'star':
+            self._create_star_tables()
+        else:
+            self._create_fact_table()
+        
+        self.create_rollup_tables(drop=drop)
+        self.create_sketch_table(drop=drop)
+        self._create_metadata_table()
+        self.db.commit()
+    
+    def _create_fact_table(self):
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS fact_sales (
                 order_id INTEGER,
                 customer_id INTEGER,
                 product_id INTEGER,
@@ -66,46 +207,349 @@ class DataLoader:
                 gross_profit REAL
             )
         """)
-        
-        self.conn.commit()
-    
-    def load_table(self, df, table_name, columns):
-        df[columns].to_sql(table_name, self.conn, if_exists='append', index=False)
-        print(f"  Loaded {len(df)} records into {table_name}")
-        return len(df)
     
-    def create_indexes(self):
-        cur = self.conn.cursor()
-        cur.execute("CREATE INDEX idx_sales_date ON fact_sales(order_date)")
-        cur.execute("CREATE INDEX idx_sales_customer ON fact_sales(customer_id)")
-        cur.execute("CREATE INDEX idx_sales_product ON fact_sales(product_id)")
-        self.conn.commit()
+    def _create_star_tables(self):
+        for column, (table, key) in STAR_DIMENSIONS.items():
+            self.db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {key} INTEGER PRIMARY KEY,
+                    {column} TEXT UNIQUE
+                )
+            """)
+        
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS dim_date (
+                date_key INTEGER PRIMARY KEY,
+                order_date DATE,
+                order_month TEXT,
+                order_year INTEGER,
+                order_quarter INTEGER,
+                day_of_week TEXT
+            )
+        """)
+        
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS fact_sales (
+                order_id INTEGER,
+                customer_id INTEGER,
+                product_id INTEGER,
+                date_key INTEGER,
+                status_key INTEGER,
+                category_key INTEGER,
+                segment_key INTEGER,
+                country_key INTEGER,
+                price_tier_key INTEGER,
+                quantity INTEGER,
+                unit_price REAL,
+                total_amount REAL,
+                shipping_cost REAL,
+                total_order_value REAL,
+                revenue REAL,
+                cost_of_goods REAL,
+                gross_profit REAL
+            )
+        """)
     
-    def load_all(self, data):
-        print("\n--- LOAD ---")
+    def _surrogate_keys(self, series, table, key, column):
+        # map labels to stable integer keys, adding rows for labels not seen before
+        keys = self._dim_keys.get(table)
+        if keys is None:
+            keys = dict(self.db.execute(f"SELECT {column}, {key} FROM {table}").fetchall())
+            self._dim_keys[table] = keys
         
-        self.create_schema()
+        codes, labels = pd.factorize(series)
+        new = [label for label in labels if label not in keys]
+        if new:
+            next_key = max(keys.values(), default=0) + 1
+            rows = [(next_key + i, label) for i, label in enumerate(new)]
+            self.db.executemany(f"INSERT INTO {table} ({key}, {column}) VALUES (?, ?)", rows)
+            keys.update((label, k) for k, label in rows)
         
-        self.load_table(data['customers'], 'dim_customers', 
-                       ['customer_id', 'customer_name', 'email', 'registration_date',
-                        'country', 'customer_segment', 'days_since_registration'])
+        mapped = np.append(np.asarray([keys[label] for label in labels], dtype=object), None)
+        return mapped[codes]
+    
+    def _date_keys(self, dates):
+        known = self._dim_keys.setdefault('dim_date', set())
+        date_keys = dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day
         
-        self.load_table(data['products'], 'dim_products',
-                       ['product_id', 'product_name', 'category', 'base_price',
-                        'cost', 'profit_margin', 'price_tier'])
+        unique = pd.Series(dates.unique()).dropna()
+        unique_keys = unique.dt.year * 10000 + unique.dt.month * 100 + unique.dt.day
+        new = ~unique_keys.isin(known)
+        if new.any():
+            unique, unique_keys = unique[new], unique_keys[new]
+            rows = zip(unique_keys.tolist(), unique.dt.strftime('%Y-%m-%d %H:%M:%S').tolist(),
+                       unique.dt.strftime('%Y-%m').tolist(), unique.dt.year.tolist(),
+                       unique.dt.quarter.tolist(), unique.dt.day_name().tolist())
+            self.db.executemany("INSERT OR IGNORE INTO dim_date VALUES (?, ?, ?, ?, ?, ?)", rows)
+            known.update(unique_keys.tolist())
+        return date_keys
+    
+    def _to_star(self, df):
+        star = pd.DataFrame({
+            'order_id': df['order_id'],
+            'customer_id': df['customer_id'],
+            'product_id': df['product_id'],
+            'date_key': self._date_keys(df['order_date'])
+        })
+        for column, (table, key) in STAR_DIMENSIONS.items():
+            star[key] = self._surrogate_keys(df[column], table, key, column)
+        for column in STAR_FACT_COLUMNS[star.shape[1]:]:
+            star[column] = df[column]
+        return star
+    
+    def create_rollup_tables(self, drop=True):
+        existing = self.db.tables()
+        for table, keys in ROLLUPS.items():
+            if drop:
+                self.db.execute(f"DROP TABLE IF EXISTS {table}")
+            key_cols = ', '.join(f"{k} {ROLLUP_KEY_TYPES[k]}" for k in keys)
+            self.db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {key_cols},
+                    total_revenue REAL,
+                    total_profit REAL,
+                    units_sold INTEGER,
+                    order_count INTEGER,
+                    PRIMARY KEY ({', '.join(keys)})
+                )
+            """)
+            if not drop and table not in existing and 'fact_sales' in existing and self.storage == 'denormalized':
+                # first incremental run against a database loaded before rollups existed
+                self.db.execute(f"""
+                    INSERT INTO {table}
+                    SELECT {', '.join(map(_rollup_key, keys))}, SUM(revenue), SUM(gross_profit), SUM(quantity), COUNT(*)
+                    FROM fact_sales
+                    WHERE status = 'Completed'
+                    GROUP BY {', '.join(map(_rollup_key, keys))}
+                """)
+    
+    def create_sketch_table(self, drop=True):
+        if drop or not self.sketches:
+            # a load without sketches would leave existing ones behind the data
+            self.db.execute("DROP TABLE IF EXISTS agg_sketches")
+        if self.sketches:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS agg_sketches (
+                    rollup TEXT,
+                    group_key TEXT,
+                    metric TEXT,
+                    sketch BLOB,
+                    PRIMARY KEY (rollup, group_key, metric)
+                )
+            """)
+    
+    def _accumulate_sketches(self, completed):
+        if completed.empty:
+            return
+        hashes = {column: hash_values(completed[column].to_numpy(dtype=np.int64))
+                  for kind, column in SKETCH_METRICS.values() if kind == 'hll'}
+        for rollup, key in SKETCH_ROLLUPS.items():
+            if key is None:
+                groups = [('', np.arange(len(completed)))]
+            else:
+                groups = completed.groupby(known_labels(completed[key]), observed=True).indices.items()
+            for group, positions in groups:
+                for metric, (kind, column) in SKETCH_METRICS.items():
+                    sketch = self._sketch_deltas.get((rollup, str(group), metric))
+                    if sketch is None:
+                        sketch = self._sketch_deltas[(rollup, str(group), metric)] = SKETCH_TYPES[kind]()
+                    if kind == 'hll':
+                        sketch.update_hashes(hashes[column][positions])
+                    else:
+                        sketch.update(completed[column].to_numpy()[positions])
+    
+    def _backfill_sketches(self):
+        # first sketched load into a database whose fact rows were loaded without them
+        for chunk in self.db.read_sql(SKETCH_SOURCE_QUERIES[self.storage], chunksize=self.batch_size):
+            self._accumulate_sketches(chunk)
+    
+    def update_sketches(self):
+        if not self._sketch_deltas:
+            return
+        stored = {(rollup, group, metric): blob for rollup, group, metric, blob in
+                  self.db.execute("SELECT rollup, group_key, metric, sketch FROM agg_sketches").fetchall()}
+        rows = []
+        for (rollup, group, metric), sketch in self._sketch_deltas.items():
+            blob = stored.get((rollup, group, metric))
+            if blob is not None:
+                sketch.merge(load_sketch(metric, blob))
+            rows.append((rollup, group, metric, sketch.to_bytes()))
+        self.db.executemany(
+            "INSERT INTO agg_sketches (rollup, group_key, metric, sketch) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(rollup, group_key, metric) DO UPDATE SET sketch = excluded.sketch",
+            rows
+        )
+        self._sketch_deltas = {}
+    
+    def _accumulate_rollups(self, df):
+        completed = df[df['status'] == 'Completed']
+        if self.sketches:
+            self._accumulate_sketches(completed)
+        measures = pd.DataFrame({
+            'total_revenue': completed['revenue'],
+            'total_profit': completed['gross_profit'],
+            'units_sold': completed['quantity'],
+            'order_count': 1
+        })
+        for table, keys in ROLLUPS.items():
+            group = [completed[k].astype(str) if k == 'order_month' else known_labels(completed[k]) for k in keys]
+            delta = measures.groupby(group, dropna=False, observed=True).sum()
+            prev = self._rollup_deltas.get(table)
+            self._rollup_deltas[table] = delta if prev is None else prev.add(delta, fill_value=0)
+    
+    def update_rollups(self):
+        for table, keys in ROLLUPS.items():
+            delta = self._rollup_deltas.get(table)
+            if delta is None or delta.empty:
+                continue
+            additions = ', '.join(f"{m} = {m} + excluded.{m}" for m in ROLLUP_MEASURES)
+            self.db.insert(table, keys + ROLLUP_MEASURES, [delta.reset_index()], self.batch_size,
+                           f"ON CONFLICT({', '.join(keys)}) DO UPDATE SET {additions}")
+        self._rollup_deltas = {}
+    
+    def _create_metadata_table(self):
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS etl_metadata (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+    
+    def get_watermark(self):
+        self._create_metadata_table()
+        rows = dict(self.db.execute(
+            "SELECT key, value FROM etl_metadata WHERE key IN ('last_order_id', 'last_order_date')"
+        ).fetchall())
+        if 'last_order_id' not in rows:
+            return None, None
+        last_date = rows.get('last_order_date')
+        return int(rows['last_order_id']), pd.Timestamp(last_date) if last_date else None
+    
+    def get_storage(self):
+        self._create_metadata_table()
+        row = self.db.execute("SELECT value FROM etl_metadata WHERE key = 'storage'").fetchone()
+        return row[0] if row else None
+    
+    def set_metadata(self, **values):
+        self.db.executemany(
+            "INSERT INTO etl_metadata (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            [(key, str(value)) for key, value in values.items()]
+        )
+    
+    def set_watermark(self, order_id, order_date):
+        self.set_metadata(last_order_id=order_id, last_order_date=order_date)
+    
+    def load_table(self, df, table_name, columns):
+        return self.load_table_chunks([df], table_name, columns)
+    
+    def upsert_table(self, df, table_name, columns, key):
+        return self.load_table_chunks([df], table_name, columns, upsert_key=key)
+    
+    def load_table_chunks(self, chunks, table_name, columns, upsert_key=None):
+        on_conflict = ''
+        if upsert_key:
+            updates = ', '.join(f"{c} = excluded.{c}" for c in columns if c != upsert_key)
+            on_conflict = f"ON CONFLICT({upsert_key}) DO UPDATE SET {updates}"
         
-        df = data['fact_sales'].copy()
-        df['order_month'] = df['order_month'].astype(str)
-        self.load_table(df, 'fact_sales', df.columns.tolist())
+        start = time.perf_counter()
+        with stage(f'load_table.{table_name}') as s, self.db.transaction():
+            total = self.db.insert(table_name, columns, chunks, self.batch_size, on_conflict)
+            s['rows_out'] = total
+        elapsed = time.perf_counter() - start
         
-        self.create_indexes()
+        action = 'Upserted' if upsert_key else 'Loaded'
+        print(f"  {action} {total} records into {table_name} ({total / max(elapsed, 1e-9):,.0f} rows/sec)")
+        return total
+    
+    def _fact_chunks(self, fact_sales):
+        if isinstance(fact_sales, pd.DataFrame):
+            fact_sales = [fact_sales]
+        for df in fact_sales:
+            self._accumulate_rollups(df)
+            if len(df):
+                self._max_order_id = max(self._max_order_id or 0, int(df['order_id'].max()))
+                last_date = df['order_date'].max()
+                self._max_order_date = max(self._max_order_date or last_date, last_date)
+            yield self._to_star(df) if self.storage == 'star' else df
+    
+    def create_indexes(self):
+        if not self.db.supports_indexes:
+            return
+        if self.storage == 'star':
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_sales_date_key ON fact_sales(date_key)")
+        else:
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_sales_date ON fact_sales(order_date)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_sales_customer ON fact_sales(customer_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_sales_product ON fact_sales(product_id)")
+        if self.report_indexes:
+            self.create_report_indexes()
+        self.db.commit()
+    
+    def create_report_indexes(self):
+        for name, (columns, where) in REPORT_INDEXES[self.storage].items():
+            partial = f" WHERE {where}" if where else ""
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON fact_sales({columns}){partial}")
+        # the planner only prefers the narrow indexes over a table scan once it has statistics
+        self.db.execute("ANALYZE")
+        print(f"  Created report indexes: {', '.join(REPORT_INDEXES[self.storage])}")
+    
+    def load_all(self, data, incremental=False):
+        print("\n--- LOAD ---")
         
-        cur = self.conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM fact_sales WHERE status = 'Completed'")
-        completed = cur.fetchone()[0]
+        with self.db.bulk_load_settings():
+            self._max_order_id, self._max_order_date = self.get_watermark()
+            self._rollup_deltas = {}
+            self._sketch_deltas = {}
+            self._dim_keys = {}
+            
+            if incremental:
+                stored = self.get_storage()
+                if stored is not None and stored != self.storage:
+                    raise ValueError(f"Database uses {stored} storage; run a full load to switch to {self.storage}")
+                had_sketches = 'agg_sketches' in self.db.tables()
+                self.create_schema(drop=False)
+                # rows above the watermark can only come from an interrupted run; clear them so reruns stay idempotent
+                if self._max_order_id is not None:
+                    self.db.execute("DELETE FROM fact_sales WHERE order_id > ?", (self._max_order_id,))
+                    self.db.commit()
+                if self.sketches and not had_sketches:
+                    self._backfill_sketches()
+                
+                self.upsert_table(data['customers'], 'dim_customers', CUSTOMER_COLUMNS, 'customer_id')
+                self.upsert_table(data['products'], 'dim_products', PRODUCT_COLUMNS, 'product_id')
+            else:
+                self.create_schema()
+                self._max_order_id = self._max_order_date = None
+                
+                self.load_table(data['customers'], 'dim_customers', CUSTOMER_COLUMNS)
+                self.load_table(data['products'], 'dim_products', PRODUCT_COLUMNS)
+            
+            self.load_table_chunks(self._fact_chunks(data['fact_sales']), 'fact_sales', self.fact_columns)
+            
+            # rollups and the watermark move together, so an interrupted run is redone as a whole
+            with stage('update_rollups'), self.db.transaction():
+                self.update_rollups()
+                if self.sketches:
+                    self.update_sketches()
+                if self._max_order_id is not None:
+                    self.set_watermark(self._max_order_id, self._max_order_date)
+                # readers key their caches on this stamp
+                self.set_metadata(data_version=uuid.uuid4().hex, loaded_at=datetime.now().isoformat(),
+                                  storage=self.storage)
+            print(f"  Updated rollups: {', '.join(ROLLUPS)}")
+            if self.sketches:
+                print(f"  Updated sketches: {', '.join(SKETCH_METRICS)} per {', '.join(SKETCH_ROLLUPS)} group")
+            if self._max_order_id is not None:
+                print(f"  High-water mark: order_id {self._max_order_id}, order_date {self._max_order_date}")
+            
+            with stage('create_indexes'):
+                self.create_indexes()
         
-        cur.execute("SELECT SUM(revenue), SUM(gross_profit) FROM fact_sales WHERE status = 'Completed'")
-        rev, profit = cur.fetchone()
+        totals = self.db.execute(
+            "SELECT SUM(order_count), SUM(total_revenue), SUM(total_profit) FROM agg_monthly"
+        ).fetchone()
+        completed, rev, profit = (value or 0 for value in totals)
         
         print(f"\nDatabase summary:")
         print(f"  {completed:,} completed orders")
@@ -113,7 +557,7 @@ class DataLoader:
         print(f"  ${profit:,.2f} total profit")
         print(f"\nSaved to: {self.db_path}")
         
-        self.conn.close()
+        self.db.close()
 
 if __name__ == "__main__":
     from extract import DataExtractor
@@ -0,0 +1,74 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+
+# runs an iterator in a thread and hands its items over a bounded queue. A full queue blocks the
+# producer (backpressure); a producer error is re-raised in the consumer, and closing the
+# consumer stops the producer at its next item.
+class BackgroundIterator:
+    def __init__(self, iterable, maxsize=2, name='stage'):
+        self.name = name
+        self.items = 0
+        self.producer_wait = 0.0
+        self.consumer_wait = 0.0
+        self._queue = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(iterable,), name=f'pipeline-{name}',
+                                        daemon=True)
+        self._thread.start()
+    
+    def _put(self, item):
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.producer_wait += time.perf_counter() - start
+    
+    def _produce(self, iterable):
+        it = iter(iterable)
+        try:
+            for item in it:
+                if not self._put((item, None)):
+                    return
+            self._put((_DONE, None))
+        except BaseException as exc:
+            self._put((_DONE, exc))
+        finally:
+            close = getattr(it, 'close', None)
+            if close is not None:
+                close()
+    
+    def __iter__(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                item, exc = self._queue.get()
+                self.consumer_wait += time.perf_counter() - start
+                if item is _DONE:
+                    if exc is not None:
+                        raise exc
+                    return
+                self.items += 1
+                yield item
+        finally:
+            self.close()
+    
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+    
+    def summary(self):
+        # a producer that mostly waits is faster than its consumer, and the other way round
+        return (f"  [{self.name}] {self.items} chunks, producer blocked {self.producer_wait:.2f}s, "
+                f"consumer waited {self.consumer_wait:.2f}s")
+
+def background(iterable, maxsize=2, name='stage'):
+    return BackgroundIterator(iterable, maxsize, name)
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+def hash_values(values):
+    # 64-bit hashes that are stable across processes and runs, so stored sketches stay mergeable
+    return pd.util.hash_array(np.asarray(values))
+
+def _bit_length(x):
+    length = np.zeros(len(x), dtype=np.uint8)
+    x = x.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= np.uint64(1 << shift)
+        x[big] >>= np.uint64(shift)
+        length[big] += shift
+    return length + (x > 0)
+
+# distinct counts in 2**precision one-byte registers; the standard error is 1.04 / sqrt(2**precision),
+# about 1.6% at the default precision. Two sketches merge by taking the register-wise maximum.
+class HyperLogLog:
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+    
+    def update(self, values):
+        self.update_hashes(hash_values(values))
+        return self
+    
+    def update_hashes(self, hashes):
+        if len(hashes) == 0:
+            return self
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # position of the leftmost one bit in the remaining 64 - p bits
+        rank = (64 - p + 1 - _bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+    
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+    
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * m and zeros:
+            # linear counting is more accurate while many registers are still empty
+            return m * np.log(m / zeros)
+        return raw
+    
+    def to_bytes(self):
+        return bytes([self.precision]) + self.registers.tobytes()
+    
+    @classmethod
+    def from_bytes(cls, blob):
+        sketch = cls(blob[0])
+        sketch.registers = np.frombuffer(blob, dtype=np.uint8, offset=1).copy()
+        return sketch
+
+# KLL quantile sketch: level h holds items that each stand for 2**h inputs. A full level is sorted
+# and every other item (random offset) is promoted, so memory stays near 3k items and the rank error
+# is about 1.7 / k of the input size.
+class KLLSketch:
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+    
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+    
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+    
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+    
+    def _compress(self):
+        # a new top level shrinks every capacity below it, so repeat until all levels fit
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self.levels)):
+                items = self.levels[level]
+                if len(items) <= self._capacity(level):
+                    continue
+                compacted = True
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays behind so the promoted half carries exactly double weight
+                even = len(items) - len(items) % 2
+                self.levels[level] = items[even:]
+                promoted = items[self._rng.integers(2):even:2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+    
+    def quantiles(self, qs):
+        items = np.concatenate(self.levels)
+        if len(items) == 0:
+            return np.full(len(qs), np.nan)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level)
+                                  for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cum = np.cumsum(weights[order])
+        ranks = np.clip(np.searchsorted(cum, np.asarray(qs) * cum[-1], side='left'), 0, len(items) - 1)
+        return items[order][ranks]
+    
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+    
+    def to_bytes(self):
+        header = np.array([self.k, self.n, len(self.levels)] + [len(items) for items in self.levels],
+                          dtype=np.int64)
+        return header.tobytes() + np.concatenate(self.levels).astype(np.float64).tobytes()
+    
+    @classmethod
+    def from_bytes(cls, blob):
+        k, n, num_levels = np.frombuffer(blob, dtype=np.int64, count=3)
+        sizes = np.frombuffer(blob, dtype=np.int64, count=num_levels, offset=24)
+        items = np.frombuffer(blob, dtype=np.float64, offset=24 + 8 * int(num_levels))
+        sketch = cls(int(k))
+        sketch.n = int(n)
+        sketch.levels = [items[start:end].copy()
+                         for start, end in zip(np.cumsum(sizes) - sizes, np.cumsum(sizes))]
+        return sketch
+
+SKETCH_TYPES = {'hll': HyperLogLog, 'kll': KLLSketch}
+
+# what DataLoader keeps per group of each listed rollup ('all' is a single group over every completed row)
+SKETCH_ROLLUPS = {
+    'all': None,
+    'agg_segment': 'customer_segment',
+    'agg_category': 'category',
+    'agg_country': 'country'
+}
+
+# metric -> (sketch type, fact column)
+SKETCH_METRICS = {
+    'customers': ('hll', 'customer_id'),
+    'products': ('hll', 'product_id'),
+    'revenue': ('kll', 'revenue')
+}
+
+def load_sketch(metric, blob):
+    return SKETCH_TYPES[SKETCH_METRICS[metric][0]].from_bytes(bytes(blob))
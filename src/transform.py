@@ -1,61 +1,382 @@
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 from datetime import datetime
+import hashlib
+import json
+import os
+
+try:
+    from instrument import stage
+except ImportError:
+    from src.instrument import stage
+
+PARTITION_KEYS = ['month', 'customer']
+
+# columns the fact table adds to the cleaned orders
+PRODUCT_FACT_COLUMNS = ['category', 'cost', 'profit_margin', 'price_tier']
+CUSTOMER_FACT_COLUMNS = ['customer_segment', 'country']
+FACT_ENRICHMENT_COLUMNS = PRODUCT_FACT_COLUMNS + CUSTOMER_FACT_COLUMNS + ['revenue', 'cost_of_goods', 'gross_profit']
+
+ENRICHMENT_METHODS = ['lookup', 'merge']
+
+# ids up to this value are resolved through a dense id -> row array instead of a hash lookup
+DENSE_LOOKUP_LIMIT = 10_000_000
+
+DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# target dtypes for every table; integer downcasts only happen when the values fit.
+# money columns stay float64 so cent-rounded amounts sum exactly enough for the reports.
+DTYPE_POLICY = {
+    'order_id': 'int32',
+    'customer_id': 'int32',
+    'product_id': 'int32',
+    'quantity': 'int16',
+    'order_year': 'int16',
+    'order_quarter': 'int8',
+    'days_since_registration': 'int16',
+    'country': 'category',
+    'customer_segment': 'category',
+    'category': 'category',
+    'status': 'category',
+    'day_of_week': pd.CategoricalDtype(DAYS_OF_WEEK),
+    'price_tier': 'category'
+}
+
+def apply_dtype_policy(df):
+    # shallow copy: casts replace whole columns and never write into the caller's arrays
+    df = df.copy(deep=False)
+    for col, dtype in DTYPE_POLICY.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype != 'category' and not isinstance(dtype, pd.CategoricalDtype):
+            if not pd.api.types.is_integer_dtype(df[col]):
+                continue
+            info = np.iinfo(dtype)
+            if len(df) and (df[col].min() < info.min or df[col].max() > info.max):
+                continue
+        df[col] = df[col].astype(dtype)
+    return df
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+def median_from_counts(counts):
+    # exact median from value counts; shipping costs are rounded to cents so the counts stay small
+    if counts is None or counts.empty:
+        return float('nan')
+    counts = counts.sort_index()
+    cum = counts.cumsum().to_numpy()
+    n = cum[-1]
+    lo = counts.index[np.searchsorted(cum, (n - 1) // 2, side='right')]
+    hi = counts.index[np.searchsorted(cum, n // 2, side='right')]
+    return (lo + hi) / 2
+
+def partition_orders(orders, partition_by='month', num_partitions=1):
+    # exact duplicate rows share their month and customer, so every partition can dedupe on its own
+    if partition_by == 'month':
+        codes = pd.factorize(orders['order_date'].dt.to_period('M'))[0]
+    elif partition_by == 'customer':
+        codes = pd.util.hash_array(orders['customer_id'].to_numpy()) % num_partitions
+    else:
+        raise ValueError(f"Unsupported partition key: {partition_by}")
+    
+    for positions in pd.Series(codes).groupby(codes).indices.values():
+        part = orders.take(positions)
+        part.index = positions
+        yield part
+
+def dimension_positions(dim_ids, ids):
+    # row of each id in the dimension, -1 when the id is missing (what a left merge leaves as NaN)
+    dim_ids = np.asarray(dim_ids)
+    ids = np.asarray(ids)
+    if len(dim_ids) and dim_ids.min() >= 0 and dim_ids.max() <= DENSE_LOOKUP_LIMIT:
+        lookup = np.full(dim_ids.max() + 2, -1, dtype=np.int64)
+        lookup[dim_ids] = np.arange(len(dim_ids))
+        # anything outside the id range points at the trailing -1 slot
+        return lookup[np.where((ids >= 0) & (ids <= dim_ids.max()), ids, len(lookup) - 1)]
+    return pd.Index(dim_ids).get_indexer(ids)
+
+# dimensions broadcast once to every worker process by the pool initializer
+_worker_dims = {}
+
+def _init_worker(products, customers):
+    _worker_dims['products'] = products
+    _worker_dims['customers'] = customers
+
+def _transform_partition(orders, shipping_median, dedupe=True, enrichment='lookup'):
+    transformer = DataTransformer(enrichment=enrichment)
+    clean, missing = transformer._clean_orders(orders, shipping_median, dedupe=dedupe)
+    fact = transformer._build_fact(clean, _worker_dims['products'], _worker_dims['customers'])
+    # merges renumber rows; keep the input positions so the caller can restore the serial order
+    fact.index = clean.index
+    return fact, missing
+
+def _transform_partition_unfilled(orders, enrichment='lookup'):
+    # the shipping median is global, so missing costs stay NaN and the caller fills them from the
+    # counts of every partition; duplicate rows always share a partition
+    transformer = DataTransformer(enrichment=enrichment)
+    orders = orders.drop_duplicates()
+    counts = orders['shipping_cost'].value_counts()
+    clean, missing = transformer._clean_orders(orders, dedupe=False, fill_shipping=False)
+    fact = transformer._build_fact(clean, _worker_dims['products'], _worker_dims['customers'])
+    fact.index = clean.index
+    return fact, missing, counts
+
+def fingerprint_file(path, known=None):
+    # size and mtime decide whether the stored content hash can be reused
+    stat = os.stat(path)
+    if known and known.get('size') == stat.st_size and known.get('mtime_ns') == stat.st_mtime_ns:
+        return known
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+def code_version():
+    # cleaned frames depend on how inputs are read and transformed
+    digest = hashlib.sha256()
+    for name in ['extract.py', 'transform.py']:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+class TransformCache:
+    def __init__(self, cache_dir='output/.cache/transform', max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = code_version()
+        self.index_path = os.path.join(cache_dir, 'fingerprints.json')
+        os.makedirs(cache_dir, exist_ok=True)
+        self._fingerprints = self._load_index()
+    
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                return json.load(f)
+        return {}
+    
+    def fingerprint(self, path):
+        path = os.path.abspath(path)
+        known = self._fingerprints.get(path)
+        fp = fingerprint_file(path, known)
+        if fp is not known:
+            self._fingerprints[path] = fp
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._fingerprints, f, indent=2)
+            os.replace(tmp, self.index_path)
+        return fp['sha256']
+    
+    def key(self, name, *parts):
+        digest = hashlib.sha256('\x00'.join([self.version] + [str(p) for p in parts]).encode()).hexdigest()
+        return f'{name}-{digest[:24]}'
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.parquet')
+    
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        df = pd.read_parquet(path)
+        os.utime(path)
+        return df
+    
+    def put(self, key, df):
+        path = self._path(key)
+        tmp = path + '.tmp'
+        df.to_parquet(tmp)
+        os.replace(tmp, path)
+        self._evict()
+    
+    def _evict(self):
+        # least recently used entries go first until the cache fits its size budget
+        paths = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.parquet')]
+        paths.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(p) for p in paths)
+        for path in paths[:-1]:
+            if total <= self.max_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
 
 class DataTransformer:
-    def __init__(self):
+    def __init__(self, workers=1, partition_by='month', enrichment='lookup'):
+        if partition_by not in PARTITION_KEYS:
+            raise ValueError(f"Unsupported partition key: {partition_by}")
+        if enrichment not in ENRICHMENT_METHODS:
+            raise ValueError(f"Unsupported enrichment method: {enrichment}")
+        self.workers = workers
+        self.partition_by = partition_by
+        self.enrichment = enrichment
         self.stats = {}
+        self._seen_runs = []
     
     def clean_customers(self, df):
         print("\nCleaning customers...")
         orig = len(df)
-        df = df.drop_duplicates(subset=['customer_id'])
+        before = memory_mb(df)
+        df = apply_dtype_policy(df.drop_duplicates(subset=['customer_id']))
         
-        df['country'] = df['country'].replace({'USA': 'United States', 'UK': 'United Kingdom'})
+        df['country'] = df['country'].astype(object).replace({'USA': 'United States', 'UK': 'United Kingdom'})
         df['registration_date'] = pd.to_datetime(df['registration_date'])
         df['days_since_registration'] = (datetime.now() - df['registration_date']).dt.days
+        df = apply_dtype_policy(df)
         
         print(f"  Removed {orig - len(df)} duplicates -> {len(df)} records")
+        self._report_memory('customers', before, df)
         return df
     
     def clean_products(self, df):
         print("\nCleaning products...")
+        before = memory_mb(df)
+        df = apply_dtype_policy(df)
         df['profit_margin'] = ((df['base_price'] - df['cost']) / df['base_price'] * 100).round(2)
         df['price_tier'] = pd.cut(df['base_price'], bins=[0, 50, 150, 500], labels=['Budget', 'Mid-Range', 'Premium'])
         print(f"  Added profit metrics -> {len(df)} records")
+        self._report_memory('products', before, df)
         return df
     
-    def clean_orders(self, df):
+    def clean_orders(self, df, shipping_median=None):
         print("\nCleaning orders...")
         orig = len(df)
-        df = df.drop_duplicates()
+        before = memory_mb(df)
+        df, missing = self._clean_orders(df, shipping_median)
         
-        missing = df['shipping_cost'].isna().sum()
         if missing > 0:
-            median_cost = df['shipping_cost'].median()
-            df['shipping_cost'] = df['shipping_cost'].fillna(median_cost)
             print(f"  Filled {missing} missing shipping costs")
+        print(f"  Removed {orig - len(df)} invalid records -> {len(df)} records")
+        self._report_memory('orders', before, df)
+        return df
+    
+    def _report_memory(self, name, before, df):
+        after = memory_mb(df)
+        self.stats[f'{name}_memory_mb'] = (before, after)
+        print(f"  Memory: {before:,.1f} MB -> {after:,.1f} MB")
+    
+    def _clean_orders(self, df, shipping_median=None, dedupe=True, fill_shipping=True):
+        if dedupe:
+            df = df.drop_duplicates()
+        df = apply_dtype_policy(df)
+        
+        missing = df['shipping_cost'].isna().sum()
+        if missing > 0 and fill_shipping:
+            median_cost = df['shipping_cost'].median() if shipping_median is None else shipping_median
+            df['shipping_cost'] = df['shipping_cost'].fillna(median_cost)
         
         df['order_month'] = df['order_date'].dt.to_period('M')
-        df['order_year'] = df['order_date'].dt.year
-        df['order_quarter'] = df['order_date'].dt.quarter
-        df['day_of_week'] = df['order_date'].dt.day_name()
+        df['order_year'] = df['order_date'].dt.year.astype(DTYPE_POLICY['order_year'])
+        df['order_quarter'] = df['order_date'].dt.quarter.astype(DTYPE_POLICY['order_quarter'])
+        df['day_of_week'] = pd.Categorical.from_codes(df['order_date'].dt.dayofweek, dtype=DTYPE_POLICY['day_of_week'])
         df['total_order_value'] = df['total_amount'] + df['shipping_cost']
         
-        df = df[df['total_order_value'] > 0]
+        valid = df['total_order_value'] > 0
+        if not fill_shipping:
+            # decided once the missing shipping cost is filled
+            valid |= df['shipping_cost'].isna()
+        if not valid.all():
+            df = df[valid]
+        return df, missing
+    
+    def shipping_cost_median(self, chunks):
+        # over the deduplicated rows, like the median the in-memory and parallel paths take
+        self._seen_runs = []
+        counts = None
+        for chunk in chunks:
+            vc = self._drop_seen_duplicates(chunk)['shipping_cost'].value_counts()
+            counts = vc if counts is None else counts.add(vc, fill_value=0)
+        self._seen_runs = []
+        return median_from_counts(counts)
+    
+    def _drop_seen_duplicates(self, df):
+        # duplicates can span chunks, so remember the hashes of every row emitted so far. They are kept
+        # as sorted runs that merge like a binary counter, so each hash is re-sorted O(log n) times
+        # instead of once per chunk. Memory still grows with the file, about 8 bytes per distinct row.
+        hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        dup = pd.Series(hashes).duplicated().to_numpy()
+        # sorted lookups walk each run in order instead of jumping around it
+        order = np.argsort(hashes, kind='stable')
+        sorted_hashes = hashes[order]
+        for run in self._seen_runs:
+            pos = np.searchsorted(run, sorted_hashes).clip(max=len(run) - 1)
+            dup[order[run[pos] == sorted_hashes]] = True
+        new = sorted_hashes[~dup[order]]
+        if len(new):
+            runs = self._seen_runs + [new]
+            while len(runs) > 1 and len(runs[-2]) <= 2 * len(runs[-1]):
+                runs[-2:] = [np.sort(np.concatenate(runs[-2:]), kind='stable')]
+            self._seen_runs = runs
+        return df[~dup]
+    
+    def clean_orders_chunks(self, chunks, shipping_median):
+        self._seen_runs = []
+        orig = kept = missing = 0
+        for chunk in chunks:
+            orig += len(chunk)
+            chunk = self._drop_seen_duplicates(chunk)
+            chunk, filled = self._clean_orders(chunk, shipping_median, dedupe=False)
+            missing += filled
+            kept += len(chunk)
+            yield chunk
         
-        print(f"  Removed {orig - len(df)} invalid records -> {len(df)} records")
-        return df
+        print("\nCleaning orders...")
+        if missing > 0:
+            print(f"  Filled {missing} missing shipping costs")
+        print(f"  Removed {orig - kept} invalid records -> {kept} records")
     
     def create_fact_sales(self, orders, products, customers):
         print("\nBuilding fact table...")
+        before = memory_mb(orders)
+        
+        fact = self._build_fact(orders, products, customers)
+        
+        completed = fact[fact['status'] == 'Completed']
+        total_rev = completed['revenue'].sum()
+        total_profit = completed['gross_profit'].sum()
         
+        print(f"  Created {len(fact)} sales records")
+        print(f"  Total revenue: ${total_rev:,.2f}")
+        print(f"  Total profit: ${total_profit:,.2f}")
+        self._report_memory('fact_sales', before, fact)
+        
+        return fact
+    
+    def _build_fact(self, orders, products, customers):
+        if (self.enrichment == 'lookup' and products['product_id'].is_unique
+                and customers['customer_id'].is_unique):
+            return self._build_fact_lookup(orders, products, customers)
+        return self._build_fact_merge(orders, products, customers)
+    
+    def _build_fact_lookup(self, orders, products, customers):
+        # dimensions are tiny: gather their columns by row position instead of hash-joining full frames
+        product_rows = dimension_positions(products['product_id'], orders['product_id'])
+        customer_rows = dimension_positions(customers['customer_id'], orders['customer_id'])
+        
+        # same columns and row order as the left merges, without copying the order columns
+        fact = orders.copy(deep=False)
+        fact.index = pd.RangeIndex(len(fact))
+        for col in PRODUCT_FACT_COLUMNS:
+            fact[col] = pd.api.extensions.take(products[col].array, product_rows, allow_fill=True)
+        for col in CUSTOMER_FACT_COLUMNS:
+            fact[col] = pd.api.extensions.take(customers[col].array, customer_rows, allow_fill=True)
+        
+        revenue = fact['total_amount'].to_numpy()
+        cost_of_goods = fact['cost'].to_numpy() * fact['quantity'].to_numpy()
+        fact['revenue'] = revenue.copy()
+        fact['cost_of_goods'] = cost_of_goods
+        fact['gross_profit'] = revenue - cost_of_goods
+        return fact
+    
+    def _build_fact_merge(self, orders, products, customers):
         fact = orders.merge(
-            products[['product_id', 'category', 'cost', 'profit_margin', 'price_tier']],
+            products[['product_id'] + PRODUCT_FACT_COLUMNS],
             on='product_id',
             how='left'
         ).merge(
-            customers[['customer_id', 'customer_segment', 'country']],
+            customers[['customer_id'] + CUSTOMER_FACT_COLUMNS],
             on='customer_id',
             how='left'
         )
@@ -63,24 +384,137 @@ class DataTransformer:
         fact['revenue'] = fact['total_amount']
         fact['cost_of_goods'] = fact['cost'] * fact['quantity']
         fact['gross_profit'] = fact['revenue'] - fact['cost_of_goods']
+        return fact
+    
+    def create_fact_sales_chunks(self, orders_chunks, products, customers):
+        rows = 0
+        total_rev = total_profit = 0.0
+        for orders in orders_chunks:
+            fact = self._build_fact(orders, products, customers)
+            completed = fact[fact['status'] == 'Completed']
+            rows += len(fact)
+            total_rev += completed['revenue'].sum()
+            total_profit += completed['gross_profit'].sum()
+            yield fact
         
-        completed = fact[fact['status'] == 'Completed']
-        total_rev = completed['revenue'].sum()
-        total_profit = completed['gross_profit'].sum()
+        print("\nBuilding fact table...")
+        print(f"  Created {rows} sales records")
+        print(f"  Total revenue: ${total_rev:,.2f}")
+        print(f"  Total profit: ${total_profit:,.2f}")
+    
+    def _pool(self, products, customers):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(products, customers))
+    
+    def transform_orders_parallel(self, orders, products, customers):
+        print(f"\nCleaning orders and building fact table in {self.workers} processes "
+              f"(partitioned by {self.partition_by})...")
+        before = memory_mb(orders)
+        parts = list(partition_orders(orders, self.partition_by, self.workers * 2))
+        
+        # one trip through the pool: partitions come back with missing shipping costs unfilled, plus
+        # the counts of their deduplicated shipping costs for the global median
+        with self._pool(products, customers) as pool:
+            results = list(pool.map(_transform_partition_unfilled, parts, [self.enrichment] * len(parts)))
+        
+        fact = pd.concat([f for f, _, _ in results]).sort_index()
+        missing = sum(m for _, m, _ in results)
+        if missing > 0:
+            counts = None
+            for _, _, vc in results:
+                counts = vc if counts is None else counts.add(vc, fill_value=0)
+            median_cost = median_from_counts(counts)
+            unfilled = fact['shipping_cost'].isna()
+            fact.loc[unfilled, 'shipping_cost'] = median_cost
+            fact.loc[unfilled, 'total_order_value'] = fact.loc[unfilled, 'total_amount'] + median_cost
+            fact = fact[fact['total_order_value'] > 0]
+        
+        clean = fact.drop(columns=FACT_ENRICHMENT_COLUMNS)
+        clean.index = orders.index[clean.index]
+        fact = fact.reset_index(drop=True)
         
+        if missing > 0:
+            print(f"  Filled {missing} missing shipping costs")
+        print(f"  Removed {len(orders) - len(fact)} invalid records -> {len(fact)} records")
+        
+        completed = fact[fact['status'] == 'Completed']
         print(f"  Created {len(fact)} sales records")
+        print(f"  Total revenue: ${completed['revenue'].sum():,.2f}")
+        print(f"  Total profit: ${completed['gross_profit'].sum():,.2f}")
+        self._report_memory('fact_sales', before, fact)
+        return clean, fact
+    
+    def _submit_chunks(self, pool, chunks, shipping_median):
+        # keep a few chunks in flight and hand back futures in input order
+        pending = deque()
+        for chunk in chunks:
+            future = pool.submit(_transform_partition, self._drop_seen_duplicates(chunk), shipping_median,
+                                 False, self.enrichment)
+            pending.append((future, len(chunk)))
+            if len(pending) >= self.workers * 2:
+                yield pending.popleft()
+        yield from pending
+    
+    def create_fact_sales_chunks_parallel(self, chunks, shipping_median, products, customers):
+        # cross-chunk dedup keeps its state in this process; cleaning and merges run in the pool
+        self._seen_runs = []
+        orig = rows = missing = 0
+        total_rev = total_profit = 0.0
+        with self._pool(products, customers) as pool:
+            for future, read in self._submit_chunks(pool, chunks, shipping_median):
+                fact, filled = future.result()
+                orig += read
+                missing += filled
+                rows += len(fact)
+                completed = fact[fact['status'] == 'Completed']
+                total_rev += completed['revenue'].sum()
+                total_profit += completed['gross_profit'].sum()
+                yield fact.reset_index(drop=True)
+        
+        print("\nCleaning orders...")
+        if missing > 0:
+            print(f"  Filled {missing} missing shipping costs")
+        print(f"  Removed {orig - rows} invalid records -> {rows} records")
+        print("\nBuilding fact table...")
+        print(f"  Created {rows} sales records")
         print(f"  Total revenue: ${total_rev:,.2f}")
         print(f"  Total profit: ${total_profit:,.2f}")
-        
-        return fact
     
     def transform_all(self, data):
         print("\n--- TRANSFORM ---")
         
-        customers = self.clean_customers(data['customers'])
-        products = self.clean_products(data['products'])
-        orders = self.clean_orders(data['orders'])
-        fact_sales = self.create_fact_sales(orders, products, customers)
+        with stage('clean_customers', rows_in=len(data['customers'])) as s:
+            customers = self.clean_customers(data['customers'])
+            s['rows_out'] = len(customers)
+        with stage('clean_products', rows_in=len(data['products'])) as s:
+            products = self.clean_products(data['products'])
+            s['rows_out'] = len(products)
+        
+        if not isinstance(data['orders'], pd.DataFrame):
+            shipping_median = self.shipping_cost_median(data['shipping_costs'])
+            if self.workers > 1:
+                fact_sales = self.create_fact_sales_chunks_parallel(data['orders'], shipping_median,
+                                                                    products, customers)
+            else:
+                orders = self.clean_orders_chunks(data['orders'], shipping_median)
+                fact_sales = self.create_fact_sales_chunks(orders, products, customers)
+            return {
+                'customers': customers,
+                'products': products,
+                'fact_sales': fact_sales
+            }
+        
+        if self.workers > 1:
+            with stage('transform_orders_parallel', rows_in=len(data['orders'])) as s:
+                orders, fact_sales = self.transform_orders_parallel(data['orders'], products, customers)
+                s['rows_out'] = len(fact_sales)
+        else:
+            with stage('clean_orders', rows_in=len(data['orders'])) as s:
+                orders = self.clean_orders(data['orders'])
+                s['rows_out'] = len(orders)
+            with stage('create_fact_sales', rows_in=len(orders)) as s:
+                fact_sales = self.create_fact_sales(orders, products, customers)
+                s['rows_out'] = len(fact_sales)
         
         return {
             'customers': customers,
@@ -89,6 +523,90 @@ class DataTransformer:
             'fact_sales': fact_sales
         }
 
+    def transform_files(self, extractor, cache, after_order_id=None):
+        # each cleaned table depends on one input file; fact_sales depends on all three
+        print("\n--- EXTRACT / TRANSFORM (cached) ---")
+        fps = {name: ','.join(cache.fingerprint(path) for path in extractor.input_files(name))
+               for name in ['customers', 'products', 'orders']}
+        keys = {
+            # days_since_registration is relative to today
+            'customers': cache.key('customers', fps['customers'], datetime.now().date()),
+            'products': cache.key('products', fps['products']),
+            'orders': cache.key('orders', fps['orders'], after_order_id),
+            'fact_sales': cache.key('fact_sales', fps['orders'], fps['products'], fps['customers'],
+                                    after_order_id)
+        }
+        # the loader never reads the cleaned orders, so they are only fetched to rebuild fact_sales
+        data = {name: self._cached(cache, name, keys[name]) for name in ['customers', 'products', 'fact_sales']}
+        
+        if data['customers'] is None:
+            with stage('clean_customers') as s:
+                data['customers'] = self.clean_customers(extractor.extract_customers())
+                s['rows_out'] = len(data['customers'])
+            cache.put(keys['customers'], data['customers'])
+        if data['products'] is None:
+            with stage('clean_products') as s:
+                data['products'] = self.clean_products(extractor.extract_products())
+                s['rows_out'] = len(data['products'])
+            cache.put(keys['products'], data['products'])
+        
+        if data['fact_sales'] is None:
+            data['orders'] = self._cached(cache, 'orders', keys['orders'])
+            if data['orders'] is None and self.workers > 1:
+                with stage('transform_orders_parallel') as s:
+                    data['orders'], data['fact_sales'] = self.transform_orders_parallel(
+                        extractor.extract_orders(after_order_id), data['products'], data['customers'])
+                    s['rows_out'] = len(data['fact_sales'])
+                cache.put(keys['orders'], data['orders'])
+            else:
+                if data['orders'] is None:
+                    with stage('clean_orders') as s:
+                        data['orders'] = self.clean_orders(extractor.extract_orders(after_order_id))
+                        s['rows_out'] = len(data['orders'])
+                    cache.put(keys['orders'], data['orders'])
+                with stage('create_fact_sales') as s:
+                    data['fact_sales'] = self.create_fact_sales(data['orders'], data['products'], data['customers'])
+                    s['rows_out'] = len(data['fact_sales'])
+            cache.put(keys['fact_sales'], data['fact_sales'])
+        return data
+    
+    def _cached(self, cache, name, key):
+        df = cache.get(key)
+        if df is not None:
+            print(f"Cache hit: {name} ({len(df)} rows)")
+        return df
+
+    def save(self, data, output_dir):
+        print(f"\nSaving transformed data to {output_dir}/")
+        os.makedirs(output_dir, exist_ok=True)
+        saved = {}
+        for name, df in data.items():
+            path = os.path.join(output_dir, f'{name}.parquet')
+            if isinstance(df, pd.DataFrame):
+                df.to_parquet(path, index=False)
+                print(f"  Saved {path}")
+                saved[name] = df
+            else:
+                saved[name] = self._save_chunks(df, path)
+        return saved
+    
+    def _save_chunks(self, chunks, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        writer = None
+        try:
+            for df in chunks:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                yield df
+        finally:
+            if writer is not None:
+                writer.close()
+                print(f"  Saved {path}")
+
 if __name__ == "__main__":
     from extract import DataExtractor
     
@@ -1,190 +1,735 @@
-import sqlite3
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+import hashlib
+import json
+import pickle
 import os
+import re
 
-class DataVisualizer:
-    def __init__(self, db_path='output/ecommerce.db'):
-        self.db_path = db_path
-        self.output_dir = 'output'
-        os.makedirs(self.output_dir, exist_ok=True)
-        
-    def load_data(self, query):
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
-    
-    def monthly_revenue_chart(self):
-        query = """
-            SELECT order_month, SUM(revenue) as total_revenue, SUM(gross_profit) as total_profit
+try:
+    from backends import DEFAULT_DB_PATHS, connect
+    from instrument import stage
+    from sketches import load_sketch
+except ImportError:
+    from src.backends import DEFAULT_DB_PATHS, connect
+    from src.instrument import stage
+    from src.sketches import load_sketch
+
+# report queries over the raw fact table
+FACT_QUERIES = {
+    'monthly_revenue': """
+        SELECT order_month, SUM(revenue) as total_revenue, SUM(gross_profit) as total_profit
+        FROM fact_sales
+        WHERE status = 'Completed'
+        GROUP BY order_month
+        ORDER BY order_month
+    """,
+    'category_performance': """
+        SELECT category, 
+               SUM(revenue) as total_revenue,
+               SUM(gross_profit) as total_profit,
+               COUNT(*) as order_count
+        FROM fact_sales
+        WHERE status = 'Completed'
+        GROUP BY category
+        ORDER BY total_revenue DESC
+    """,
+    'customer_segments': """
+        SELECT customer_segment, 
+               SUM(revenue) as total_revenue,
+               COUNT(DISTINCT customer_id) as customer_count
+        FROM fact_sales
+        WHERE status = 'Completed'
+        GROUP BY customer_segment
+    """,
+    'top_products': """
+        SELECT p.product_name, p.category,
+               SUM(f.revenue) as total_revenue,
+               SUM(f.quantity) as units_sold
+        FROM fact_sales f
+        JOIN dim_products p ON f.product_id = p.product_id
+        WHERE f.status = 'Completed'
+        GROUP BY p.product_id, p.product_name, p.category
+        ORDER BY total_revenue DESC
+        LIMIT 10
+    """,
+    'country_analysis': """
+        SELECT country, 
+               SUM(revenue) as total_revenue,
+               COUNT(*) as order_count,
+               AVG(revenue) as avg_order_value
+        FROM fact_sales
+        WHERE status = 'Completed'
+        GROUP BY country
+        ORDER BY total_revenue DESC
+    """,
+    'summary_stats': """
+        SELECT 
+            COUNT(DISTINCT customer_id) as total_customers,
+            COUNT(DISTINCT product_id) as total_products,
+            COUNT(*) as total_orders,
+            SUM(revenue) as total_revenue,
+            SUM(gross_profit) as total_profit,
+            AVG(revenue) as avg_order_value,
+            AVG(gross_profit) / AVG(revenue) * 100 as avg_profit_margin
+        FROM fact_sales
+        WHERE status = 'Completed'
+    """
+}
+
+# the same reports read from the rollup tables DataLoader maintains
+ROLLUP_QUERIES = {
+    'monthly_revenue': """
+        SELECT order_month, total_revenue, total_profit
+        FROM agg_monthly
+        ORDER BY order_month
+    """,
+    'category_performance': """
+        SELECT category, total_revenue, total_profit, order_count
+        FROM agg_category
+        ORDER BY total_revenue DESC
+    """,
+    'customer_segments': """
+        SELECT s.customer_segment,
+               s.total_revenue,
+               (SELECT COUNT(*) FROM agg_customer c
+                WHERE c.customer_segment = s.customer_segment) as customer_count
+        FROM agg_segment s
+    """,
+    'top_products': """
+        SELECT p.product_name, p.category,
+               a.total_revenue,
+               a.units_sold
+        FROM agg_product a
+        JOIN dim_products p ON a.product_id = p.product_id
+        ORDER BY a.total_revenue DESC
+        LIMIT 10
+    """,
+    'country_analysis': """
+        SELECT country,
+               total_revenue,
+               order_count,
+               total_revenue / order_count as avg_order_value
+        FROM agg_country
+        ORDER BY total_revenue DESC
+    """,
+    'summary_stats': """
+        SELECT
+            (SELECT COUNT(DISTINCT customer_id) FROM agg_customer) as total_customers,
+            (SELECT COUNT(*) FROM agg_product) as total_products,
+            SUM(order_count) as total_orders,
+            SUM(total_revenue) as total_revenue,
+            SUM(total_profit) as total_profit,
+            SUM(total_revenue) / SUM(order_count) as avg_order_value,
+            SUM(total_profit) / SUM(total_revenue) * 100 as avg_profit_margin
+        FROM agg_monthly
+    """
+}
+
+# fact queries for the star layout: aggregate on integer keys, then join the small label tables
+COMPLETED_KEY = "(SELECT status_key FROM dim_status WHERE status = 'Completed')"
+
+STAR_FACT_QUERIES = {
+    'monthly_revenue': f"""
+        SELECT d.order_month, SUM(a.total_revenue) as total_revenue, SUM(a.total_profit) as total_profit
+        FROM (
+            SELECT date_key, SUM(revenue) as total_revenue, SUM(gross_profit) as total_profit
             FROM fact_sales
-            WHERE status = 'Completed'
-            GROUP BY order_month
-            ORDER BY order_month
-        """
-        df = self.load_data(query)
-        
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=df['order_month'], y=df['total_revenue'], 
-                                 mode='lines+markers', name='Revenue', line=dict(width=3)))
-        fig.add_trace(go.Scatter(x=df['order_month'], y=df['total_profit'], 
-                                 mode='lines+markers', name='Profit', line=dict(width=3)))
-        
-        fig.update_layout(title='Monthly Revenue & Profit Trend', 
-                         xaxis_title='Month', yaxis_title='Amount ($)',
-                         hovermode='x unified', height=500)
-        
-        fig.write_html(f'{self.output_dir}/monthly_revenue.html')
-        print("  Created monthly_revenue.html")
-    
-    def category_performance_chart(self):
-        query = """
-            SELECT category, 
+            WHERE status_key = {COMPLETED_KEY}
+            GROUP BY date_key
+        ) a
+        JOIN dim_date d ON a.date_key = d.date_key
+        GROUP BY d.order_month
+        ORDER BY d.order_month
+    """,
+    'category_performance': f"""
+        SELECT c.category, a.total_revenue, a.total_profit, a.order_count
+        FROM (
+            SELECT category_key,
                    SUM(revenue) as total_revenue,
                    SUM(gross_profit) as total_profit,
                    COUNT(*) as order_count
             FROM fact_sales
-            WHERE status = 'Completed'
-            GROUP BY category
-            ORDER BY total_revenue DESC
-        """
-        df = self.load_data(query)
-        
-        fig = make_subplots(rows=1, cols=2, subplot_titles=('Revenue by Category', 'Profit by Category'))
-        
-        fig.add_trace(go.Bar(x=df['category'], y=df['total_revenue'], name='Revenue',
-                            marker_color='lightblue'), row=1, col=1)
-        fig.add_trace(go.Bar(x=df['category'], y=df['total_profit'], name='Profit',
-                            marker_color='lightgreen'), row=1, col=2)
-        
-        fig.update_layout(height=500, showlegend=False, title_text="Category Performance Analysis")
-        fig.write_html(f'{self.output_dir}/category_performance.html')
-        print("  Created category_performance.html")
-    
-    def customer_segment_chart(self):
-        query = """
-            SELECT customer_segment, 
+            WHERE status_key = {COMPLETED_KEY}
+            GROUP BY category_key
+        ) a
+        LEFT JOIN dim_category c ON a.category_key = c.category_key
+        ORDER BY a.total_revenue DESC
+    """,
+    'customer_segments': f"""
+        SELECT s.customer_segment, a.total_revenue, a.customer_count
+        FROM (
+            SELECT segment_key,
                    SUM(revenue) as total_revenue,
                    COUNT(DISTINCT customer_id) as customer_count
             FROM fact_sales
-            WHERE status = 'Completed'
-            GROUP BY customer_segment
-        """
-        df = self.load_data(query)
-        
-        fig = go.Figure(data=[go.Pie(labels=df['customer_segment'], 
-                                     values=df['total_revenue'],
-                                     hole=.3)])
-        fig.update_layout(title='Revenue by Customer Segment', height=500)
-        fig.write_html(f'{self.output_dir}/customer_segments.html')
-        print("  Created customer_segments.html")
-    
-    def top_products_chart(self):
-        query = """
-            SELECT p.product_name, p.category,
-                   SUM(f.revenue) as total_revenue,
-                   SUM(f.quantity) as units_sold
-            FROM fact_sales f
-            JOIN dim_products p ON f.product_id = p.product_id
-            WHERE f.status = 'Completed'
-            GROUP BY p.product_id
-            ORDER BY total_revenue DESC
-            LIMIT 10
-        """
-        df = self.load_data(query)
-        
-        fig = go.Figure(go.Bar(
-            x=df['total_revenue'],
-            y=df['product_name'],
-            orientation='h',
-            marker_color='coral'
-        ))
-        fig.update_layout(title='Top 10 Products by Revenue', 
-                         xaxis_title='Revenue ($)', yaxis_title='Product',
-                         height=500)
-        fig.write_html(f'{self.output_dir}/top_products.html')
-        print("  Created top_products.html")
-    
-    def country_analysis_chart(self):
-        query = """
-            SELECT country, 
+            WHERE status_key = {COMPLETED_KEY}
+            GROUP BY segment_key
+        ) a
+        LEFT JOIN dim_segment s ON a.segment_key = s.segment_key
+    """,
+    'top_products': f"""
+        SELECT p.product_name, p.category,
+               SUM(f.revenue) as total_revenue,
+               SUM(f.quantity) as units_sold
+        FROM fact_sales f
+        JOIN dim_products p ON f.product_id = p.product_id
+        WHERE f.status_key = {COMPLETED_KEY}
+        GROUP BY p.product_id, p.product_name, p.category
+        ORDER BY total_revenue DESC
+        LIMIT 10
+    """,
+    'country_analysis': f"""
+        SELECT c.country, a.total_revenue, a.order_count, a.avg_order_value
+        FROM (
+            SELECT country_key,
                    SUM(revenue) as total_revenue,
                    COUNT(*) as order_count,
                    AVG(revenue) as avg_order_value
             FROM fact_sales
-            WHERE status = 'Completed'
-            GROUP BY country
-            ORDER BY total_revenue DESC
-        """
-        df = self.load_data(query)
+            WHERE status_key = {COMPLETED_KEY}
+            GROUP BY country_key
+        ) a
+        LEFT JOIN dim_country c ON a.country_key = c.country_key
+        ORDER BY a.total_revenue DESC
+    """,
+    'summary_stats': f"""
+        SELECT 
+            COUNT(DISTINCT customer_id) as total_customers,
+            COUNT(DISTINCT product_id) as total_products,
+            COUNT(*) as total_orders,
+            SUM(revenue) as total_revenue,
+            SUM(gross_profit) as total_profit,
+            AVG(revenue) as avg_order_value,
+            AVG(gross_profit) / AVG(revenue) * 100 as avg_profit_margin
+        FROM fact_sales
+        WHERE status_key = {COMPLETED_KEY}
+    """
+}
+
+QUERY_SOURCES = {'fact': FACT_QUERIES, 'rollup': ROLLUP_QUERIES, 'sketch': ROLLUP_QUERIES}
+
+# one pass over the completed fact rows feeds every report
+SCAN_QUERY = """
+    SELECT order_month, category, customer_segment, country, customer_id, product_id,
+           quantity, revenue, gross_profit
+    FROM fact_sales
+    WHERE status = 'Completed'
+"""
+
+STAR_SCAN_QUERY = f"""
+    SELECT d.order_month, c.category, s.customer_segment, n.country, f.customer_id, f.product_id,
+           f.quantity, f.revenue, f.gross_profit
+    FROM fact_sales f
+    LEFT JOIN dim_date d ON f.date_key = d.date_key
+    LEFT JOIN dim_category c ON f.category_key = c.category_key
+    LEFT JOIN dim_segment s ON f.segment_key = s.segment_key
+    LEFT JOIN dim_country n ON f.country_key = n.country_key
+    WHERE f.status_key = {COMPLETED_KEY}
+"""
+
+SCAN_GROUPS = ['order_month', 'category', 'customer_segment', 'country', 'product_id']
+
+def scan_report_datasets(db, chunksize=500_000, query=SCAN_QUERY):
+    measures = ['revenue', 'gross_profit', 'quantity', 'order_count']
+    partials = {key: [] for key in SCAN_GROUPS}
+    pairs = []
+    for chunk in db.read_sql(query, chunksize=chunksize):
+        chunk['order_count'] = 1
+        for key in SCAN_GROUPS:
+            partials[key].append(chunk.groupby(key, dropna=False)[measures].sum())
+        pairs.append(chunk[['customer_segment', 'customer_id']].drop_duplicates())
+    
+    agg = {}
+    for key, parts in partials.items():
+        if parts:
+            agg[key] = pd.concat(parts).groupby(level=0, dropna=False).sum()
+        else:
+            agg[key] = pd.DataFrame(columns=measures, index=pd.Index([], name=key))
+        agg[key] = agg[key].rename(columns={'revenue': 'total_revenue', 'gross_profit': 'total_profit',
+                                            'quantity': 'units_sold'}).reset_index()
+    pairs = pd.concat(pairs) if pairs else pd.DataFrame(columns=['customer_segment', 'customer_id'])
+    customers_per_segment = pairs.drop_duplicates().groupby('customer_segment').size()
+    
+    products = db.read_sql("SELECT product_id, product_name, category FROM dim_products")
+    top = agg['product_id'].merge(products, on='product_id', how='inner')
+    top = top.sort_values('total_revenue', ascending=False).head(10)
+    
+    segments = agg['customer_segment']
+    segments['customer_count'] = segments['customer_segment'].map(customers_per_segment).fillna(0).astype(int)
+    
+    country = agg['country'].sort_values('total_revenue', ascending=False)
+    country['avg_order_value'] = country['total_revenue'] / country['order_count']
+    
+    monthly = agg['order_month']
+    total_orders = monthly['order_count'].sum()
+    total_revenue = monthly['total_revenue'].sum()
+    total_profit = monthly['total_profit'].sum()
+    summary = pd.DataFrame([{
+        'total_customers': pairs['customer_id'].nunique(),
+        'total_products': len(agg['product_id']),
+        'total_orders': total_orders,
+        'total_revenue': total_revenue,
+        'total_profit': total_profit,
+        'avg_order_value': total_revenue / total_orders if total_orders else None,
+        'avg_profit_margin': total_profit / total_revenue * 100 if total_revenue else None
+    }])
+    
+    return {
+        'monthly_revenue': monthly.sort_values('order_month')[['order_month', 'total_revenue', 'total_profit']],
+        'category_performance': agg['category'].sort_values('total_revenue', ascending=False)[
+            ['category', 'total_revenue', 'total_profit', 'order_count']],
+        'customer_segments': segments[['customer_segment', 'total_revenue', 'customer_count']],
+        'top_products': top[['product_name', 'category', 'total_revenue', 'units_sold']],
+        'country_analysis': country[['country', 'total_revenue', 'order_count', 'avg_order_value']],
+        'summary_stats': summary
+    }
+
+SQL_KEYWORDS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'ON', 'GROUP', 'ORDER', 'LIMIT'}
+
+def full_table_scans(plan, query, table='fact_sales'):
+    # SQLite plan lines that read every row of the table, or of its alias, instead of an index
+    aliases = re.findall(rf'\b{table}\s+(?:AS\s+)?(\w+)', query, re.IGNORECASE)
+    names = {table} | {alias for alias in aliases if alias.upper() not in SQL_KEYWORDS}
+    # older SQLite writes 'SCAN TABLE fact_sales AS f'; a scan USING (COVERING) INDEX never matches
+    scans = (re.fullmatch(r'SCAN (?:TABLE )?(\w+)(?: AS (\w+))?', line) for line in plan)
+    return [m.string for m in scans if m and names & set(m.groups())]
+
+SKETCH_TOTALS_QUERY = """
+    SELECT SUM(order_count) as total_orders,
+           SUM(total_revenue) as total_revenue,
+           SUM(total_profit) as total_profit,
+           SUM(total_revenue) / SUM(order_count) as avg_order_value,
+           SUM(total_profit) / SUM(total_revenue) * 100 as avg_profit_margin
+    FROM agg_monthly
+"""
+
+def sketch_report_datasets(db):
+    # rollup reports with the distinct counts read from HyperLogLog sketches instead of agg_customer
+    # and agg_product, plus line-revenue percentiles from the KLL sketches
+    if 'agg_sketches' not in db.tables():
+        raise ValueError("The database has no sketches; load it with --sketches first")
+    sketches = {(rollup, group, metric): load_sketch(metric, blob) for rollup, group, metric, blob in
+                db.execute("SELECT rollup, group_key, metric, sketch FROM agg_sketches").fetchall()}
+    
+    datasets = {name: db.read_sql(ROLLUP_QUERIES[name])
+                for name in ['monthly_revenue', 'category_performance', 'top_products', 'country_analysis']}
+    
+    segments = db.read_sql("SELECT customer_segment, total_revenue FROM agg_segment")
+    segments['customer_count'] = [
+        round(sketches[('agg_segment', str(segment), 'customers')].estimate())
+        if ('agg_segment', str(segment), 'customers') in sketches else 0
+        for segment in segments['customer_segment']
+    ]
+    datasets['customer_segments'] = segments
+    
+    summary = db.read_sql(SKETCH_TOTALS_QUERY)
+    overall = {metric: sketches.get(('all', '', metric)) for metric in ['customers', 'products', 'revenue']}
+    summary.insert(0, 'total_products', round(overall['products'].estimate()) if overall['products'] else 0)
+    summary.insert(0, 'total_customers', round(overall['customers'].estimate()) if overall['customers'] else 0)
+    median, p90 = overall['revenue'].quantiles([0.5, 0.9]) if overall['revenue'] else (None, None)
+    summary['median_line_revenue'] = median
+    summary['p90_line_revenue'] = p90
+    datasets['summary_stats'] = summary
+    return datasets
+
+def monthly_revenue_figure(df):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df['order_month'], y=df['total_revenue'], 
+                             mode='lines+markers', name='Revenue', line=dict(width=3)))
+    fig.add_trace(go.Scatter(x=df['order_month'], y=df['total_profit'], 
+                             mode='lines+markers', name='Profit', line=dict(width=3)))
+    
+    fig.update_layout(title='Monthly Revenue & Profit Trend', 
+                     xaxis_title='Month', yaxis_title='Amount ($)',
+                     hovermode='x unified', height=500)
+    return fig
+
+def category_performance_figure(df):
+    from plotly.subplots import make_subplots
+    
+    fig = make_subplots(rows=1, cols=2, subplot_titles=('Revenue by Category', 'Profit by Category'))
+    
+    fig.add_trace(go.Bar(x=df['category'], y=df['total_revenue'], name='Revenue',
+                        marker_color='lightblue'), row=1, col=1)
+    fig.add_trace(go.Bar(x=df['category'], y=df['total_profit'], name='Profit',
+                        marker_color='lightgreen'), row=1, col=2)
+    
+    fig.update_layout(height=500, showlegend=False, title_text="Category Performance Analysis")
+    return fig
+
+def customer_segment_figure(df):
+    fig = go.Figure(data=[go.Pie(labels=df['customer_segment'], 
+                                 values=df['total_revenue'],
+                                 hole=.3)])
+    fig.update_layout(title='Revenue by Customer Segment', height=500)
+    return fig
+
+def top_products_figure(df):
+    fig = go.Figure(go.Bar(
+        x=df['total_revenue'],
+        y=df['product_name'],
+        orientation='h',
+        marker_color='coral'
+    ))
+    fig.update_layout(title='Top 10 Products by Revenue', 
+                     xaxis_title='Revenue ($)', yaxis_title='Product',
+                     height=500)
+    return fig
+
+def country_analysis_figure(df):
+    # plotly.express costs a third of a second to import; only pay it when this chart renders
+    import plotly.express as px
+    
+    fig = px.bar(df, x='country', y='total_revenue', 
+                title='Revenue by Country',
+                labels={'total_revenue': 'Total Revenue ($)', 'country': 'Country'})
+    return fig
+
+def summary_stats_table(df):
+    return f"""
+    <h1>E-Commerce Analytics Summary</h1>
+    <table style='border-collapse: collapse; width: 100%;'>
+        <tr style='background: #f0f0f0;'>
+            <th style='border: 1px solid #ddd; padding: 12px; text-align: left;'>Metric</th>
+            <th style='border: 1px solid #ddd; padding: 12px; text-align: right;'>Value</th>
+        </tr>
+        <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Customers</td>
+            <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>{df['total_customers'].iloc[0]:,}</td></tr>
+        <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Products</td>
+            <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>{df['total_products'].iloc[0]:,}</td></tr>
+        <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Orders</td>
+            <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>{df['total_orders'].iloc[0]:,}</td></tr>
+        <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Revenue</td>
+            <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>${df['total_revenue'].iloc[0]:,.2f}</td></tr>
+        <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Profit</td>
+            <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>${df['total_profit'].iloc[0]:,.2f}</td></tr>
+        <tr><td style='border: 1px solid #ddd; padding: 12px;'>Avg Order Value</td>
+            <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>${df['avg_order_value'].iloc[0]:,.2f}</td></tr>
+        <tr><td style='border: 1px solid #ddd; padding: 12px;'>Avg Profit Margin</td>
+            <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>{df['avg_profit_margin'].iloc[0]:.1f}%</td></tr>
+        {sketch_rows(df)}
+    </table>
+    """
+
+def sketch_rows(df):
+    # only the sketch source reports percentiles
+    if 'median_line_revenue' not in df or pd.isna(df['median_line_revenue'].iloc[0]):
+        return ''
+    return f"""<tr><td style='border: 1px solid #ddd; padding: 12px;'>Median Line Revenue (approx.)</td>
+            <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>${df['median_line_revenue'].iloc[0]:,.2f}</td></tr>
+        <tr><td style='border: 1px solid #ddd; padding: 12px;'>90th Percentile Line Revenue (approx.)</td>
+            <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>${df['p90_line_revenue'].iloc[0]:,.2f}</td></tr>"""
+
+SUMMARY_PAGE = """
+<html>
+<head><title>Summary Statistics</title></head>
+<body style='font-family: Arial; padding: 20px;'>
+{body}
+</body>
+</html>
+"""
+
+DASHBOARD_PAGE = """
+<html>
+<head>
+<meta charset="utf-8">
+<title>E-Commerce Analytics Dashboard</title>
+{script}
+</head>
+<body style='font-family: Arial; padding: 20px;'>
+{body}
+</body>
+</html>
+"""
+
+# report name -> (output file, builder returning a plotly figure or an HTML fragment)
+CHARTS = {
+    'monthly_revenue': ('monthly_revenue.html', monthly_revenue_figure),
+    'category_performance': ('category_performance.html', category_performance_figure),
+    'customer_segments': ('customer_segments.html', customer_segment_figure),
+    'top_products': ('top_products.html', top_products_figure),
+    'country_analysis': ('country_analysis.html', country_analysis_figure),
+    'summary_stats': ('summary_stats.html', summary_stats_table)
+}
+
+# how each chart file gets plotly.js: embedded, one shared plotly.min.js next to the files, or the CDN
+PLOTLYJS_MODES = {'inline': True, 'directory': 'directory', 'cdn': 'cdn'}
+
+def render_chart(name, df, output_dir, plotlyjs='inline', fragment=False):
+    filename, build = CHARTS[name]
+    chart = build(df)
+    path = os.path.join(output_dir, filename)
+    if isinstance(chart, str):
+        with open(path, 'w') as f:
+            f.write(SUMMARY_PAGE.format(body=chart))
+        return filename, chart if fragment else None
+    
+    chart.write_html(path, include_plotlyjs=PLOTLYJS_MODES[plotlyjs])
+    return filename, chart.to_html(full_html=False, include_plotlyjs=False) if fragment else None
+
+def plotlyjs_script(plotlyjs):
+    from plotly.offline import get_plotlyjs, get_plotlyjs_version
+    
+    if plotlyjs == 'directory':
+        return '<script src="plotly.min.js"></script>'
+    if plotlyjs == 'cdn':
+        return f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script>'
+    return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+
+class QueryCache:
+    def __init__(self, cache_dir, max_entries=64):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def key(self, *parts):
+        return hashlib.sha256('\x00'.join(str(p) for p in parts).encode()).hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+    
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        os.utime(path)
+        self._remember(key, value)
+        return value
+    
+    def put(self, key, value):
+        with open(self._path(key), 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, value)
+        self._evict_disk()
+    
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+    
+    def _evict_disk(self):
+        paths = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.pkl')]
+        if len(paths) <= self.max_entries:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_entries]:
+            os.remove(path)
+
+def dataset_hash(name, df, plotlyjs):
+    content = df.to_json(orient='split', date_format='iso', double_precision=15)
+    return hashlib.sha256(f'{name}\x00{plotlyjs}\x00{content}'.encode()).hexdigest()
+
+class DataVisualizer:
+    def __init__(self, db_path=None, source='rollup', plotlyjs='inline',
+                 workers=1, dashboard=False, cache_dir='output/.cache', backend='sqlite'):
+        self.db_path = db_path or DEFAULT_DB_PATHS[backend]
+        self.backend = backend
+        self.source = source
+        self.plotlyjs = plotlyjs
+        self.workers = workers
+        self.dashboard = dashboard
+        self.queries = QUERY_SOURCES.get(source, FACT_QUERIES)
+        self.output_dir = 'output'
+        self.db = None
+        self.cache = QueryCache(cache_dir) if cache_dir else None
+        self.manifest_path = os.path.join(cache_dir, 'render_manifest.json') if cache_dir else None
+        os.makedirs(self.output_dir, exist_ok=True)
+    
+    def connect(self):
+        if self.db is None:
+            self.db = connect(self.backend, self.db_path)
+        return self.db
+    
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+    
+    def _metadata(self, key):
+        db = self.connect()
+        if 'etl_metadata' not in db.tables():
+            return None
+        row = db.execute("SELECT value FROM etl_metadata WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def data_version(self):
+        return self._metadata('data_version')
+    
+    def storage(self):
+        return self._metadata('storage') or 'denormalized'
+    
+    def _cached(self, compute, *key_parts):
+        version = self.data_version() if self.cache else None
+        if version is None:
+            return compute()
+        key = self.cache.key(self.db_path, version, *key_parts)
+        value = self.cache.get(key)
+        if value is None:
+            value = compute()
+            self.cache.put(key, value)
+        return value
+    
+    def load_data(self, query):
+        return self._cached(lambda: self.connect().read_sql(query), query)
+    
+    def load_datasets(self):
+        if self.source == 'scan':
+            query = self.report_queries()['scan']
+            return self._cached(lambda: scan_report_datasets(self.connect(), query=query), query)
+        if self.source == 'sketch':
+            return self._cached(lambda: sketch_report_datasets(self.connect()), 'sketch')
+        return {name: self.load_data(query) for name, query in self.report_queries().items()}
+    
+    def load_dataset(self, name):
+        # one chart's data from the selected source; scan and sketch build every dataset in one pass
+        if self.source in ('scan', 'sketch'):
+            return self.load_datasets()[name]
+        return self.load_data(self.report_queries()[name])
+    
+    def report_queries(self):
+        star = self.storage() == 'star'
+        if self.source == 'scan':
+            return {'scan': STAR_SCAN_QUERY if star else SCAN_QUERY}
+        return STAR_FACT_QUERIES if star and self.source == 'fact' else self.queries
+    
+    def explain(self):
+        # print each report query's plan and flag the ones that read all of fact_sales
+        db = self.connect()
+        print(f"\nQuery plans ({db.name}, {self.source} source):")
+        scans = {}
+        for name, query in self.report_queries().items():
+            plan = db.explain(query)
+            print(f"\n  {name}:")
+            for line in plan:
+                print(f"    {line}")
+            if db.supports_indexes:
+                scans[name] = full_table_scans(plan, query)
+        flagged = [name for name, lines in scans.items() if lines]
+        if flagged:
+            print(f"\n  Full scans of fact_sales: {', '.join(flagged)}")
+        elif db.supports_indexes:
+            print("\n  No report query scans all of fact_sales")
+        return scans
+    
+    def _load_manifest(self):
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {}
+    
+    def _save_manifest(self, manifest):
+        if self.manifest_path:
+            with open(self.manifest_path, 'w') as f:
+                json.dump(manifest, f, indent=2)
+    
+    def _write_plotlyjs_bundle(self):
+        from plotly.offline import get_plotlyjs
         
-        fig = px.bar(df, x='country', y='total_revenue', 
-                    title='Revenue by Country',
-                    labels={'total_revenue': 'Total Revenue ($)', 'country': 'Country'})
-        fig.write_html(f'{self.output_dir}/country_analysis.html')
-        print("  Created country_analysis.html")
-    
-    def generate_summary_stats(self):
-        query = """
-            SELECT 
-                COUNT(DISTINCT customer_id) as total_customers,
-                COUNT(DISTINCT product_id) as total_products,
-                COUNT(*) as total_orders,
-                SUM(revenue) as total_revenue,
-                SUM(gross_profit) as total_profit,
-                AVG(revenue) as avg_order_value,
-                AVG(gross_profit) / AVG(revenue) * 100 as avg_profit_margin
-            FROM fact_sales
-            WHERE status = 'Completed'
-        """
-        df = self.load_data(query)
+        path = os.path.join(self.output_dir, 'plotly.min.js')
+        if not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write(get_plotlyjs())
+    
+    def render(self, name, df):
+        if self.plotlyjs == 'directory':
+            self._write_plotlyjs_bundle()
+        filename, _ = render_chart(name, df, self.output_dir, self.plotlyjs)
+        manifest = self._load_manifest()
+        manifest[name] = dataset_hash(name, df, self.plotlyjs)
+        self._save_manifest(manifest)
+        print(f"  Created {filename}")
+    
+    def render_all(self, datasets):
+        if self.plotlyjs == 'directory':
+            self._write_plotlyjs_bundle()
+        
+        # skip charts whose file is already rendered from identical data
+        manifest = self._load_manifest()
+        hashes = {name: dataset_hash(name, datasets[name], self.plotlyjs) for name in CHARTS}
+        stale = [name for name in CHARTS
+                 if manifest.get(name) != hashes[name]
+                 or not os.path.exists(os.path.join(self.output_dir, CHARTS[name][0]))]
+        dashboard_path = os.path.join(self.output_dir, 'dashboard.html')
+        if self.dashboard and (stale or not os.path.exists(dashboard_path)):
+            stale = list(CHARTS)
+        
+        for name in CHARTS:
+            if name not in stale:
+                print(f"  Unchanged {CHARTS[name][0]}")
         
-        stats_html = f"""
-        <html>
-        <head><title>Summary Statistics</title></head>
-        <body style='font-family: Arial; padding: 20px;'>
-            <h1>E-Commerce Analytics Summary</h1>
-            <table style='border-collapse: collapse; width: 100%;'>
-                <tr style='background: #f0f0f0;'>
-                    <th style='border: 1px solid #ddd; padding: 12px; text-align: left;'>Metric</th>
-                    <th style='border: 1px solid #ddd; padding: 12px; text-align: right;'>Value</th>
-                </tr>
-                <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Customers</td>
-                    <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>{df['total_customers'].iloc[0]:,}</td></tr>
-                <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Products</td>
-                    <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>{df['total_products'].iloc[0]:,}</td></tr>
-                <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Orders</td>
-                    <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>{df['total_orders'].iloc[0]:,}</td></tr>
-                <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Revenue</td>
-                    <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>${df['total_revenue'].iloc[0]:,.2f}</td></tr>
-                <tr><td style='border: 1px solid #ddd; padding: 12px;'>Total Profit</td>
-                    <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>${df['total_profit'].iloc[0]:,.2f}</td></tr>
-                <tr><td style='border: 1px solid #ddd; padding: 12px;'>Avg Order Value</td>
-                    <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>${df['avg_order_value'].iloc[0]:,.2f}</td></tr>
-                <tr><td style='border: 1px solid #ddd; padding: 12px;'>Avg Profit Margin</td>
-                    <td style='border: 1px solid #ddd; padding: 12px; text-align: right;'>{df['avg_profit_margin'].iloc[0]:.1f}%</td></tr>
-            </table>
-        </body>
-        </html>
-        """
+        args = [(name, datasets[name], self.output_dir, self.plotlyjs, self.dashboard) for name in stale]
+        if self.workers > 1 and len(args) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(render_chart, *zip(*args)))
+        else:
+            results = [render_chart(*a) for a in args]
         
-        with open(f'{self.output_dir}/summary_stats.html', 'w') as f:
-            f.write(stats_html)
-        print("  Created summary_stats.html")
+        for filename, _ in results:
+            print(f"  Created {filename}")
+        
+        manifest.update({name: hashes[name] for name in stale})
+        self._save_manifest(manifest)
+        
+        if self.dashboard and results:
+            body = "\n".join(f"<div>{fragment}</div>" for _, fragment in results)
+            with open(os.path.join(self.output_dir, 'dashboard.html'), 'w') as f:
+                f.write(DASHBOARD_PAGE.format(script=plotlyjs_script(self.plotlyjs), body=body))
+            print("  Created dashboard.html")
+    
+    def monthly_revenue_chart(self, df=None):
+        if df is None:
+            df = self.load_dataset('monthly_revenue')
+        self.render('monthly_revenue', df)
+    
+    def category_performance_chart(self, df=None):
+        if df is None:
+            df = self.load_dataset('category_performance')
+        self.render('category_performance', df)
+    
+    def customer_segment_chart(self, df=None):
+        if df is None:
+            df = self.load_dataset('customer_segments')
+        self.render('customer_segments', df)
+    
+    def top_products_chart(self, df=None):
+        if df is None:
+            df = self.load_dataset('top_products')
+        self.render('top_products', df)
+    
+    def country_analysis_chart(self, df=None):
+        if df is None:
+            df = self.load_dataset('country_analysis')
+        self.render('country_analysis', df)
+    
+    def generate_summary_stats(self, df=None):
+        if df is None:
+            df = self.load_dataset('summary_stats')
+        self.render('summary_stats', df)
     
     def run_all(self):
         print("\n--- VISUALIZE ---")
         print("\nGenerating visualizations...")
         
-        self.monthly_revenue_chart()
-        self.category_performance_chart()
-        self.customer_segment_chart()
-        self.top_products_chart()
-        self.country_analysis_chart()
-        self.generate_summary_stats()
+        try:
+            with stage('load_datasets') as s:
+                datasets = self.load_datasets()
+                s['rows_out'] = sum(len(df) for df in datasets.values())
+        finally:
+            self.close()
+        
+        with stage('render_all') as s:
+            self.render_all(datasets)
+            s['charts'] = len(datasets)
         
         print(f"\nAll visualizations saved to '{self.output_dir}/' directory")
 
@@ -0,0 +1,16 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.instrument import Instrumentation
+
+def test_stage_names_match_any_dotted_suffix():
+    instrumentation = Instrumentation()
+    name = 'pipeline.load.load_table.fact_sales'
+    
+    assert instrumentation._selected({'load_table.fact_sales'}, name)
+    assert instrumentation._selected({'fact_sales'}, name)
+    assert instrumentation._selected({'all'}, name)
+    assert not instrumentation._selected({'table.fact_sales'}, name)
+    assert not instrumentation._selected({'load_table'}, name)
@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+
+def run(cwd, *args):
+    result = subprocess.run([sys.executable, MAIN, *args], cwd=cwd, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return result
+
+def add_orphan_line(data_dir, order_id):
+    # a completed line whose product is not in products.csv
+    with open(os.path.join(data_dir, 'orders.csv'), 'a') as f:
+        f.write(f"{order_id},1,9999,2024-12-30,1,10.0,10.0,Completed,5.0\n")
+
+def query(cwd, backend, sql):
+    if backend == 'duckdb':
+        import duckdb
+        
+        db = duckdb.connect(os.path.join(cwd, 'output', 'ecommerce.duckdb'))
+    else:
+        db = sqlite3.connect(os.path.join(cwd, 'output', 'ecommerce.db'))
+    try:
+        return db.execute(sql).fetchall()
+    finally:
+        db.close()
+
+@pytest.mark.parametrize('backend', ['sqlite', 'duckdb'])
+def test_orphan_product_rolls_up_under_one_unknown_row(tmp_path, backend):
+    run(tmp_path, 'generate', '--orders', '300')
+    data_dir = os.path.join(tmp_path, 'data')
+    add_orphan_line(data_dir, 301)
+    run(tmp_path, 'load', '--backend', backend)
+    
+    # incremental runs must add to the same row instead of inserting another one
+    for order_id in (302, 303):
+        add_orphan_line(data_dir, order_id)
+        run(tmp_path, 'load', '--backend', backend, '--incremental')
+    
+    assert query(tmp_path, backend, "SELECT category, order_count FROM agg_category "
+                                    "WHERE category IS NULL OR category = 'Unknown'") == [('Unknown', 3)]
+    assert query(tmp_path, backend, "SELECT COUNT(*) FROM agg_category WHERE category IS NULL") == [(0,)]
@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+
+def run(cwd, *args):
+    return subprocess.run([sys.executable, MAIN, *args], cwd=cwd, capture_output=True, text=True, timeout=60)
+
+def test_failed_pipelined_load_exits(tmp_path):
+    # a star database makes the denormalized incremental load fail before it reads the background queues
+    assert run(tmp_path, 'generate', '--orders', '1500').returncode == 0
+    assert run(tmp_path, 'load', '--storage', 'star').returncode == 0
+    assert run(tmp_path, 'generate', '--orders', '3000', '--format', 'parquet').returncode == 0
+    
+    result = run(tmp_path, 'load', '--format', 'parquet', '--chunksize', '1000', '--pipelined', '--incremental')
+    assert result.returncode != 0
+    assert "Database uses star storage" in result.stderr
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.extract import STATUS_DTYPE
+from src.transform import DataTransformer
+
+def test_streaming_shipping_median_ignores_duplicates():
+    orders = pd.DataFrame({
+        'order_id': [1, 1, 1, 1, 2, 3, 4],
+        'order_date': pd.to_datetime(['2024-01-01'] * 7),
+        'total_amount': [10.0] * 7,
+        'shipping_cost': [1.0, 1.0, 1.0, 1.0, 2.0, 3.0, np.nan]
+    })
+    in_memory = DataTransformer().clean_orders(orders)
+    chunks = [orders.iloc[i:i + 2] for i in range(0, len(orders), 2)]
+    
+    assert DataTransformer().shipping_cost_median(chunks) == 2.0
+    assert in_memory.loc[in_memory['order_id'] == 4, 'shipping_cost'].item() == 2.0
+
+def test_parallel_transform_matches_serial():
+    from src.generate_data import generate_customers, generate_orders, generate_products
+    
+    np.random.seed(0)
+    transformer = DataTransformer()
+    customers = transformer.clean_customers(generate_customers(50))
+    products = transformer.clean_products(generate_products(10))
+    orders = generate_orders(300, customers, products, rng=np.random.RandomState(0))
+    orders['status'] = orders['status'].astype(STATUS_DTYPE)
+    orders.loc[::7, 'shipping_cost'] = np.nan
+    # a refund whose line only turns invalid once its shipping cost is filled
+    orders.loc[3, ['total_amount', 'shipping_cost']] = [-100.0, np.nan]
+    orders = pd.concat([orders, orders.iloc[:20]], ignore_index=True)
+    
+    serial_orders = transformer.clean_orders(orders)
+    serial_fact = transformer.create_fact_sales(serial_orders, products, customers)
+    parallel_orders, parallel_fact = DataTransformer(workers=2).transform_orders_parallel(orders, products, customers)
+    
+    pd.testing.assert_frame_equal(parallel_orders, serial_orders)
+    pd.testing.assert_frame_equal(parallel_fact, serial_fact.reset_index(drop=True))